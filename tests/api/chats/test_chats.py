@@ -19,3 +19,20 @@ class TestChats:
     def test_stats_text(self, group):
         text = group.members.stats_text()
         assert '位群成员' in text
+
+    def test_send_all(self, bot, friend, group, image_path, tmpdir):
+        checkpoint = str(tmpdir.join('checkpoint.txt'))
+        chats = Chats([friend, group])
+        progress = list()
+
+        result = chats.send_all(
+            '@img@{}'.format(image_path), checkpoint=checkpoint,
+            progress=lambda done, total, chat, error: progress.append((done, total, error))
+        )
+        assert len(result.sent) == 2
+        assert not result.failed
+        assert sorted(progress) == [(1, 2, None), (2, 2, None)]
+
+        result = chats.send_all('@img@{}'.format(image_path), checkpoint=checkpoint)
+        assert len(result.skipped) == 2
+        assert not result.sent
@@ -13,6 +13,11 @@ class TestGroup:
         assert not group.is_owner
         assert group.owner == friend
 
+    def test_members_cached(self, group, member):
+        assert group.members[0] is group.members[0]
+        assert group.__contains__(member) is group.__contains__(member)
+        assert len(group) == len(group.members)
+
     def test_update_group(self, group):
         group.update_group(members_details=True)
         assert group.members[-1].sex is not None
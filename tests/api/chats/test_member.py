@@ -0,0 +1,4 @@
+class TestMember:
+    def test_group(self, group, member):
+        assert member.group is group
+        assert member in member.group
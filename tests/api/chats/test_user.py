@@ -15,6 +15,21 @@ class TestUser:
         assert re.match(r'@[\da-f]{32,}', friend.user_name)
         assert friend.is_friend
 
+    def test_is_friend_identity(self, friend):
+        assert friend.is_friend is friend
+
+    def test_is_friend(self, bot, friend, member):
+        friends = bot.friends()
+        assert friend in friends
+        assert friend in Chats(friends)
+
+        # 修改合集后，仍应得到正确的结果
+        friends.remove(friend)
+        assert friend not in friends
+        friends.append(friend)
+        assert friend in friends
+        assert (member in friends) == bool(member.is_friend)
+
     # def test_add(self, member):
     #     member.add('wxpy tests: test_add')
 
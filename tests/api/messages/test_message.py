@@ -27,6 +27,8 @@ class TestMessage:
         assert msg.sender == group
         assert msg.receiver == group.self
         assert msg.member == friend
+        assert msg.chat is msg.chat
+        assert msg.member is msg.member
         assert 0 < msg.latency < 30
 
         group.send('at')
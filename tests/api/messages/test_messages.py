@@ -0,0 +1,50 @@
+from wxpy import *
+
+
+class TestMessages:
+    def test_max_history(self):
+        messages = Messages(max_history=3)
+        for i in range(5):
+            messages.append(i)
+        assert list(messages) == [2, 3, 4]
+        assert messages[0] == 2 and messages[-1] == 4
+        assert messages[1:] == [3, 4]
+
+        messages.max_history = 2
+        assert list(messages) == [3, 4]
+        messages.append(5)
+        assert list(messages) == [4, 5]
+
+    def test_oversized_initial_list(self):
+        messages = Messages(list(range(5)), max_history=1)
+        messages.append(9)
+        assert list(messages) == [9]
+
+        messages = Messages(list(range(5)), max_history=3)
+        messages.append(9)
+        assert list(messages) == [3, 4, 9]
+
+    def test_search(self, bot):
+        found = bot.messages.search(sender=bot.self)
+        assert isinstance(found, Messages)
+        for msg in found:
+            assert msg.sender == bot.self
+
+    def test_query(self, bot, friend):
+        sent = friend.send('test query')
+        found = bot.messages.query(chat=friend, sender=bot.self, msg_type=TEXT, limit=1)
+        assert list(found) == [sent]
+        assert list(bot.messages.query(chat=friend, limit=1)) == [sent]
+
+    def test_indexed_search(self, bot, friend):
+        sent = friend.send('test indexed search 索引')
+        bot.messages.indexed_search = True
+        try:
+            for keywords in 'indexed 索引', 'dexed', '索':
+                found = bot.messages.search(keywords)
+                assert sent in found
+                bot.messages.indexed_search = False
+                assert list(bot.messages.search(keywords)) == list(found)
+                bot.messages.indexed_search = True
+        finally:
+            bot.messages.indexed_search = False
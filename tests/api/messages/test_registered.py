@@ -0,0 +1,50 @@
+from wxpy import *
+
+
+class TestRegistered:
+    def test_get_config(self, bot, group, friend):
+        msg = Message(dict(FromUserName=group.user_name, ToUserName=bot.self.user_name, Type=TEXT), bot)
+
+        def by_class(_):
+            pass
+
+        def by_chat(_):
+            pass
+
+        bot.register(Group, TEXT)(by_class)
+        bot.register([friend, group], [TEXT, PICTURE])(by_chat)
+        by_class_config = bot.registered.get_config_by_func(by_class)
+        by_chat_config = bot.registered.get_config_by_func(by_chat)
+
+        try:
+            assert bot.registered.get_config(msg) is by_chat_config
+            bot.registered.disable(by_chat)
+            assert bot.registered.get_config(msg) is by_class_config
+            bot.registered.enable(by_chat)
+            bot.registered.remove(by_chat_config)
+            assert bot.registered.get_config(msg) is by_class_config
+        finally:
+            for config in by_class_config, by_chat_config:
+                if config in bot.registered:
+                    bot.registered.remove(config)
+
+    def test_modify_config(self, bot, group, friend):
+        msg = Message(dict(FromUserName=group.user_name, ToUserName=bot.self.user_name, Type=TEXT), bot)
+
+        def func(_):
+            pass
+
+        bot.register(friend, TEXT)(func)
+        config = bot.registered.get_config_by_func(func)
+
+        try:
+            assert bot.registered.get_config(msg) is None
+            config.chats.append(group)
+            assert bot.registered.get_config(msg) is config
+            config.msg_types = PICTURE
+            assert bot.registered.get_config(msg) is None
+            config.msg_types = None
+            config.chats = friend
+            assert bot.registered.get_config(msg) is None
+        finally:
+            bot.registered.remove(config)
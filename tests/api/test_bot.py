@@ -27,6 +27,23 @@ class TestBot:
         puid_map = bot.enable_puid(puid_path)
         assert isinstance(puid_map, PuidMap)
 
+    def test_enable_archive(self, bot, base_dir, friend):
+        from wxpy.utils import ArchivedMessage, MessageArchive
+        archive_path = os.path.join(base_dir, 'wxpy_bot_messages.db')
+        archive = bot.enable_archive(archive_path)
+        try:
+            assert isinstance(archive, MessageArchive)
+            friend.send('test archive 存档')
+            found = list(archive.search('存档', chat=friend, newest_first=True, limit=1))
+            assert len(found) == 1
+            assert isinstance(found[0], ArchivedMessage)
+            assert found[0].is_sent
+            assert found[0].text == 'test archive 存档'
+        finally:
+            bot.messages.archive = None
+            archive.close()
+            os.remove(archive_path)
+
     def test_chats(self, bot):
         chats = bot.chats()
         assert isinstance(chats, Chats)
@@ -39,6 +56,11 @@ class TestBot:
         for friend in friends:
             assert isinstance(friend, Friend)
 
+    def test_friends_identity(self, bot):
+        friends = bot.friends()
+        for a, b in zip(friends, bot.friends()):
+            assert a is b
+
     def test_groups(self, bot):
         groups = bot.groups()
         assert isinstance(groups, Groups)
@@ -46,6 +68,11 @@ class TestBot:
             assert isinstance(group, Group)
             assert bot.self in group
 
+    def test_groups_identity(self, bot):
+        groups = bot.groups()
+        for a, b in zip(groups, bot.groups()):
+            assert a is b
+
     def test_mps(self, bot):
         mps = bot.mps()
         assert isinstance(mps, Chats)
@@ -62,6 +89,19 @@ class TestBot:
             assert isinstance(found, Chats)
             assert found.source == bot
 
+    def test_indexed_search(self, bot):
+        keywords = bot.self.name[:2]
+        plain = bot.search(keywords)
+        bot.indexed_search = True
+        try:
+            assert bot.search(keywords) == plain
+            assert bot.friends().search(keywords) == plain.search(keywords)
+            assert bot.friends().search(sex=MALE, city=bot.self.city) == \
+                Chats(bot.friends()).search(sex=MALE, city=bot.self.city)
+            assert bot.friends().stats() == Chats(bot.friends()).stats()
+        finally:
+            bot.indexed_search = False
+
     def test_create_group(self, bot):
         users = bot.friends()[:3]
         topic = 'test creating group'
@@ -86,3 +126,19 @@ class TestBot:
     def test_upload_file(self, bot, file_path, friend):
         media_id = bot.upload_file(file_path)
         friend.send_file(file_path, media_id=media_id)
+
+    def test_chunked_upload(self, bot, video_path, friend):
+        from wxpy.utils import ChunkedUploader
+        uploader = ChunkedUploader(bot)
+        assert uploader.upload('not_exists.mp4')['BaseResponse']['Ret'] == -1002
+
+        progress = list()
+        ret = uploader.upload(video_path, 'video', progress=lambda done, total: progress.append((done, total)))
+        assert ret['MediaId']
+        assert progress[-1][0] == progress[-1][1]
+        friend.send_video(video_path, media_id=ret['MediaId'])
+
+    def test_chat_index(self, bot, friend, group):
+        assert bot.chat_index.get(friend.user_name) == friend
+        assert bot.chat_index.get(group.user_name) == group
+        assert bot.chat_index.get('@not_exists') is None
@@ -0,0 +1,26 @@
+import asyncio
+import threading
+
+from wxpy.utils import AsyncRunner, is_coroutine_function
+
+
+class TestAsyncRunner:
+    def test_submit(self):
+        runner = AsyncRunner(executor_workers=2)
+
+        async def handler(x):
+            await asyncio.sleep(0.1)
+            name = await runner.run_in_executor(lambda: threading.current_thread().name)
+            return x, name
+
+        assert is_coroutine_function(handler)
+        assert not is_coroutine_function(lambda: None)
+
+        futures = [runner.submit(handler(i)) for i in range(100)]
+        results = [future.result(timeout=5) for future in futures]
+        assert [x for x, _ in results] == list(range(100))
+        assert threading.current_thread().name not in set(name for _, name in results)
+        assert runner.is_running
+
+        runner.stop()
+        assert not runner.is_running
@@ -0,0 +1,61 @@
+import shutil
+
+from wxpy.api.consts import PICTURE
+from wxpy.exceptions import ResponseError
+from wxpy.utils import MediaCache, is_invalid_media_error, upload_kind
+
+
+class TestMediaCache:
+    def test_get_or_upload(self, tmpdir):
+        path = str(tmpdir.join('a.png'))
+        copied = str(tmpdir.join('b.png'))
+        with open(path, 'wb') as fp:
+            fp.write(b'wxpy' * 1024 * 1024)
+        shutil.copy(path, copied)
+
+        uploads = list()
+
+        def upload(_path, kind):
+            uploads.append((_path, kind))
+            return 'media_id_{}'.format(len(uploads))
+
+        cache = MediaCache()
+        assert cache.get_or_upload(path, 'pic', upload) == ('media_id_1', False)
+        assert cache.get_or_upload(path, 'pic', upload) == ('media_id_1', True)
+        assert cache.get_or_upload(copied, 'pic', upload) == ('media_id_1', True)
+        assert cache.get_or_upload(path, 'doc', upload) == ('media_id_2', False)
+
+        cache.invalidate(path, 'pic')
+        assert cache.get_or_upload(path, 'pic', upload) == ('media_id_3', False)
+
+        cache.ttl = 0
+        assert cache.get_or_upload(path, 'pic', upload) == ('media_id_4', False)
+        assert len(uploads) == 4
+
+    def test_missing_file(self, tmpdir):
+        path = str(tmpdir.join('missing.png'))
+        uploads = list()
+
+        def upload(_path, kind):
+            uploads.append((_path, kind))
+
+        cache = MediaCache()
+        assert cache.get_or_upload(path, 'pic', upload) == (None, False)
+        assert uploads == [(path, 'pic')]
+        assert not len(cache)
+        cache.invalidate(path, 'pic')
+
+    def test_upload_kind(self):
+        assert upload_kind('a.jpg') == 'pic'
+        assert upload_kind('a.gif') == 'doc'
+        assert upload_kind('a.mp4') == 'video'
+        assert upload_kind('a.txt') == 'doc'
+        assert upload_kind('a.gif', PICTURE) == upload_kind('a.gif', 'img') == 'doc'
+        assert upload_kind('a.png', 'fil') == 'doc'
+        assert upload_kind('a.png', 'msg') is None
+
+    def test_is_invalid_media_error(self):
+        assert is_invalid_media_error(ResponseError(1, 'bad media'))
+        assert not is_invalid_media_error(ResponseError(1205, 'freq limited'))
+        assert not is_invalid_media_error(ResponseError(-1002, 'No file found in specific dir'))
+        assert not is_invalid_media_error(ValueError())
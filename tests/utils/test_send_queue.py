@@ -0,0 +1,58 @@
+import time
+
+from wxpy.exceptions import ResponseError
+from wxpy.utils import SendQueue, TokenBucket
+
+
+class TestSendQueue:
+    def test_token_bucket(self):
+        bucket = TokenBucket(5, 1)
+        assert [bucket.try_acquire() for _ in range(5)] == [0] * 5
+        assert 0 < bucket.try_acquire() <= 0.2
+
+        start = time.time()
+        bucket.acquire()
+        assert 0.1 < time.time() - start < 0.5
+
+    def test_submit(self):
+        send_queue = SendQueue({'text': (5, 1)})
+        done = list()
+
+        start = time.time()
+        futures = [send_queue.submit('text', done.append, i) for i in range(10)]
+        assert time.time() - start < 0.5
+
+        for future in futures:
+            future.result(timeout=5)
+        assert 0.8 < time.time() - start < 1.5
+        assert done == list(range(10))
+
+        future = send_queue.submit('media', int, 'not a number')
+        assert isinstance(future.exception(timeout=5), ValueError)
+
+    def test_independent_operations(self):
+        send_queue = SendQueue({'add_friend': (1, 60)})
+        send_queue.submit('add_friend', int).result(timeout=5)
+
+        # 加好友的令牌已用完，其后放入的文本消息不应被堵塞
+        throttled = send_queue.submit('add_friend', int)
+        start = time.time()
+        send_queue.submit('text', int).result(timeout=5)
+        assert time.time() - start < 0.5
+        assert not throttled.done()
+
+    def test_adaptive(self, tmpdir):
+        path = str(tmpdir.join('limits.pkl'))
+        send_queue = SendQueue({'text': (8, 0.2)}, adaptive=True, path=path)
+
+        def freq_limited():
+            raise ResponseError(1205, 'freq limited')
+
+        send_queue.submit('text', freq_limited).exception(timeout=5)
+        assert send_queue.buckets['text'].count == 4
+
+        time.sleep(0.3)
+        send_queue.submit('text', int).result(timeout=5)
+        assert send_queue.buckets['text'].count == 5
+
+        assert SendQueue({'text': (8, 0.2)}, path=path).buckets['text'].count == 5
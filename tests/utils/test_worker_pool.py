@@ -0,0 +1,43 @@
+import random
+import threading
+import time
+
+from wxpy.utils import ShardedWorkerPool, WorkerPool
+
+
+class TestWorkerPool:
+    def test_submit(self):
+        pool = WorkerPool(size=2, queue_size=1, full_policy='discard')
+        event = threading.Event()
+        done = list()
+
+        accepted = [pool.submit(lambda i=i: (event.wait(), done.append(i))) for i in range(10)]
+        assert pool.workers == 2
+        assert pool.active_workers <= 2
+        assert pool.queue_depth <= 1
+        assert not all(accepted)
+
+        event.set()
+        pool.join()
+        assert len(done) == sum(accepted)
+        assert pool.active_workers == 0
+
+
+class TestShardedWorkerPool:
+    def test_submit(self):
+        pool = ShardedWorkerPool(shards=4)
+        done = dict()
+
+        def task(key, i):
+            time.sleep(random.random() / 100)
+            done.setdefault(key, list()).append(i)
+
+        for i in range(40):
+            key = 'chat{}'.format(i % 5)
+            assert pool.submit(key, task, key, i)
+
+        pool.join()
+        assert pool.workers <= 4
+        assert sum(map(len, done.values())) == 40
+        for results in done.values():
+            assert results == sorted(results)
@@ -2,33 +2,31 @@
 from __future__ import unicode_literals
 
 import atexit
-import functools
 import logging
 import os.path
 import tempfile
 import time
+import weakref
 from pprint import pformat
 from threading import Thread
 
-try:
-    import queue
-except ImportError:
-    # noinspection PyUnresolvedReferences,PyPep8Naming
-    import Queue as queue
-
 import itchat
 
-from ..api.chats import Chat, Chats, Friend, Group, MP, User
+from ..api.chats import Chat, Chats, Friend, Group, Groups, MP, User
 from ..api.consts import SYSTEM
 from ..api.messages import Message, MessageConfig, Messages, Registered
 from ..compatible import PY2
 from ..compatible.utils import force_encoded_string_output
-from ..utils import PuidMap
+from ..utils import AsyncRunner, ChatIndex, MediaCache, MessageArchive, PuidMap, SendQueue, \
+    ShardedWorkerPool, WorkerPool, is_coroutine_function
 from ..utils import enhance_connection, enhance_webwx_request, ensure_list, get_user_name, handle_response, \
-    start_new_thread, wrap_user_name
+    queued, start_new_thread, upload_kind, wrap_user_name
 
 logger = logging.getLogger(__name__)
 
+# 放入 msgList 中，用于唤醒正在等待消息的监听线程 (例如停止监听或登出时)
+_WAKE_UP = object()
+
 
 class Bot(object):
     """
@@ -79,11 +77,16 @@ class Bot(object):
         if console_qr is True:
             console_qr = 2
 
+        def exit_callback():
+            self._wake_up_listener()
+            if logout_callback:
+                logout_callback()
+
         try:
             self.core.auto_login(
                 hotReload=bool(cache_path), statusStorageDir=cache_path,
                 enableCmdQR=console_qr, picDir=qr_path, qrCallback=qr_callback,
-                loginCallback=login_callback, exitCallback=logout_callback
+                loginCallback=login_callback, exitCallback=exit_callback
             )
         except FileNotFoundError as e:
             if 'xdg-open' in e.strerror:
@@ -98,11 +101,20 @@ class Bot(object):
         self.self = User(self.core.loginInfo['User'], self)
         self.file_helper = Chat(wrap_user_name('filehelper'), self)
 
+        self.chat_index = ChatIndex(self)
+
         self.messages = Messages()
         self.registered = Registered(self)
+        self.worker_pool = WorkerPool()
+        self.ordered_pool = ShardedWorkerPool()
+        self.async_runner = AsyncRunner()
 
         self.puid_map = None
+        self.send_queue = None
+        self.media_cache = MediaCache()
+        self.uploader = None
         self.auto_mark_as_read = False
+        self.indexed_search = False
 
         self.is_listening = False
         self.listening_thread = None
@@ -132,7 +144,10 @@ class Bot(object):
 
         logger.info('{}: logging out'.format(self))
 
-        return self.core.logout()
+        try:
+            return self.core.logout()
+        finally:
+            self._wake_up_listener()
 
     @property
     def alive(self):
@@ -145,6 +160,8 @@ class Bot(object):
     @alive.setter
     def alive(self, value):
         self.core.alive = value
+        if not value:
+            self._wake_up_listener()
 
     def dump_login_status(self, cache_path=None):
         logger.debug('{}: dumping login status'.format(self))
@@ -177,6 +194,64 @@ class Bot(object):
         self.puid_map = PuidMap(path)
         return self.puid_map
 
+    def enable_archive(self, path='wxpy_messages.db'):
+        """
+        **可选操作:** 将收发的消息存档到本地 SQLite 数据库中，不受 `bot.messages.max_history` 的限制::
+
+            archive = bot.enable_archive('wxpy_messages.db')
+
+            # 搜索存档中某个群的所有包含 "合同" 的消息 (逐条从数据库中读取)
+            for msg in archive.search('合同', chat='公司微信群'):
+                print(msg)
+
+        ..  tip::
+
+            | 存档中的聊天对象以 user_name, 名称和 puid 的形式保存
+            | 由于 user_name 在每次登陆后都会变化，建议同时启用 :any:`puid <Bot.enable_puid>`
+
+        :param path: 数据库文件的路径
+        :return: 消息存档
+        :rtype: :class:`wxpy.utils.MessageArchive`
+        """
+
+        self.messages.archive = MessageArchive(path)
+        return self.messages.archive
+
+    def enable_send_queue(self, limits=None, adaptive=True):
+        """
+        **可选操作:** 启用发送队列，在发送前主动控制各类操作的频率，避免触发频率限制 (错误码 1205)
+
+        启用后，以下操作将放入队列，并立即返回 `concurrent.futures.Future`，同类操作由其后台线程按调用顺序依次执行，各类操作互不堵塞
+
+        * 聊天对象的 `send()` 系列方法 (包括 `send_raw_msg()`)，以及消息的 `reply()` 系列方法
+        * :meth:`User.set_remark_name`
+        * :meth:`Bot.add_friend` 和 :meth:`Bot.accept_friend`
+
+        ::
+
+            # 文本消息在 60 秒内最多发送 30 条
+            bot.enable_send_queue({'text': (30, 60)})
+
+            future = bot.file_helper.send('Hello')
+            # 需要时可堵塞等待结果
+            sent = future.result()
+
+        | 默认开启自适应频率: 遇到频率限制 (错误码 1205) 时降低该类操作的次数，此后逐步回升 (不超过 limits 中的设定)
+        | 若设置了 `cache_path`，调整后的次数将保存在其旁边 (例如 'wxpy.pkl' 对应 'wxpy_limits.pkl')，重启后继续使用
+
+        :param limits: 各类操作的频率限制，格式为 {操作类型: (次数, 周期秒数)}，详见 :class:`wxpy.utils.SendQueue`
+        :param adaptive: 是否根据频率限制错误自动调整各类操作的次数
+        :return: 发送队列
+        :rtype: :class:`wxpy.utils.SendQueue`
+        """
+
+        path = None
+        if adaptive and self.cache_path:
+            path = '{}_limits.pkl'.format(os.path.splitext(self.cache_path)[0])
+
+        self.send_queue = SendQueue(limits, adaptive=adaptive, path=path)
+        return self.send_queue
+
     def except_self(self, chats_or_dicts):
         """
         从聊天对象合集或用户字典列表中排除自身
@@ -203,7 +278,34 @@ class Bot(object):
         with self.core.storageClass.updateLock:
             return getattr(self.core.storageClass, attr)
 
-    @handle_response(Friend)
+    def _update_itchat_storage(self, itchat_func, **kwargs):
+        """
+        请求 itchat 更新本地联系人，并将聊天对象索引标记为过期
+
+        :return: itchat 函数的返回值
+        """
+
+        @handle_response()
+        def do():
+            return itchat_func(**kwargs)
+
+        try:
+            return do()
+        finally:
+            self.chat_index.invalidate()
+
+    def _storage_chats(self, attr, chat_class):
+        """
+        将 itchat 本地联系人列表转为 Chats，附带 user_name 集合，当开启 indexed_search 时另附带搜索索引
+        """
+
+        search_index = self.chat_index.storage_search_index(attr, chat_class)
+        chats = Chats(search_index.chats, weakref.proxy(self))
+        chats._user_names = self.chat_index.storage_user_names(attr, chat_class)
+        if self.indexed_search:
+            chats._search_index = search_index
+        return chats
+
     def friends(self, update=False):
         """
         获取所有好友
@@ -215,11 +317,10 @@ class Bot(object):
 
         if update:
             logger.info('{}: updating friends'.format(self))
-            return self.core.get_friends(update=update)
-        else:
-            return self._retrieve_itchat_storage('memberList')
+            self._update_itchat_storage(self.core.get_friends, update=update)
+
+        return self._storage_chats('memberList', Friend)
 
-    @handle_response(Group)
     def groups(self, update=False, contact_only=False):
         """
         获取所有群聊对象
@@ -238,11 +339,19 @@ class Bot(object):
 
         if update or contact_only:
             logger.info('{}: updating groups'.format(self))
-            return self.core.get_chatrooms(update=update, contactOnly=contact_only)
-        else:
-            return self._retrieve_itchat_storage('chatroomList')
+            ret = self._update_itchat_storage(
+                self.core.get_chatrooms, update=update, contactOnly=contact_only)
+
+            if contact_only:
+                # itchat 返回的是副本，在此换成对应的长期聊天对象
+                group_list = list()
+                for raw in ret:
+                    group = self.chat_index.storage_chat('chatroomList', Group, raw.get('UserName'))
+                    group_list.append(group or Group(raw, weakref.proxy(self)))
+                return Groups(group_list)
+
+        return Groups(self.chat_index.storage_chats('chatroomList', Group))
 
-    @handle_response(MP)
     def mps(self, update=False):
         """
         获取所有公众号
@@ -254,9 +363,9 @@ class Bot(object):
 
         if update:
             logger.info('{}: updating mps'.format(self))
-            return self.core.get_mps(update=update)
-        else:
-            return self._retrieve_itchat_storage('mpList')
+            self._update_itchat_storage(self.core.get_mps, update=update)
+
+        return self._storage_chats('mpList', MP)
 
     @handle_response(User)
     def user_details(self, user_or_users, chunk_size=50):
@@ -304,10 +413,17 @@ class Bot(object):
         :rtype: :class:`wxpy.Chats`
         """
 
-        return self.chats().search(keywords, **attributes)
+        # 分别在各个合集中搜索，以便利用其搜索索引，结果与 self.chats().search() 一致
+        return Chats(
+            self.friends().search(keywords, **attributes) +
+            self.groups().search(keywords, **attributes) +
+            self.mps().search(keywords, **attributes),
+            self
+        )
 
     # add / create
 
+    @queued('add_friend')
     @handle_response()
     def add_friend(self, user, verify_content=''):
         """
@@ -345,6 +461,7 @@ class Bot(object):
             autoUpdate=True
         )
 
+    @queued('add_friend')
     def accept_friend(self, user, verify_content=''):
         """
         接受用户为好友
@@ -368,9 +485,7 @@ class Bot(object):
 
         do()
         # 若上一步没有抛出异常，则返回该好友
-        for friend in self.friends():
-            if friend == user:
-                return friend
+        return self.chat_index.storage_chat('memberList', Friend, get_user_name(user))
 
     def create_group(self, users, topic=None):
         """
@@ -396,7 +511,9 @@ class Bot(object):
         ret = request()
         user_name = ret.get('ChatRoomName')
         if user_name:
-            return Group(self.core.update_chatroom(userName=user_name), self)
+            raw = self.core.update_chatroom(userName=user_name)
+            self.chat_index.invalidate()
+            return self.chat_index.storage_chat('chatroomList', Group, user_name) or Group(raw, self)
         else:
             from wxpy.utils import decode_text_from_webwx
             ret = decode_text_from_webwx(pformat(ret))
@@ -404,32 +521,58 @@ class Bot(object):
 
     # upload
 
-    def upload_file(self, path):
+    def upload_file(self, path, progress=None):
         """
         | 上传文件，并获取 media_id
         | 可用于重复发送图片、表情、视频，和文件
 
+        ..  tip:: 若启用了 `bot.media_cache` (默认启用)，相同内容的文件在有效期内不会重复上传
+
+        ..  note:: 与 `send_image()` 一致，GIF 图片以文件方式上传，因此两者可共用缓存的 media_id
+
         :param path: 文件路径
+        :param progress: 上传进度回调，接收参数: 已上传的字节数, 总字节数 (需启用 `bot.uploader`，使用缓存时不会调用)
         :return: media_id
         :rtype: str
         """
 
+        kind = upload_kind(path)
+
+        def upload(_path, _kind):
+            return self._upload_media(_path, _kind, progress)
+
+        if self.media_cache is not None:
+            return self.media_cache.get_or_upload(path, kind, upload)[0]
+        return upload(path, kind)
+
+    def _upload_media(self, path, kind, progress=None):
+        """
+        上传文件 (不使用缓存)
+
+        :param path: 文件路径
+        :param kind: 上传类型 ('pic', 'video' 或 'doc')
+        :param progress: 上传进度回调
+        :return: media_id
+        """
+
         logger.info('{}: uploading file: {}'.format(self, path))
 
         @handle_response()
         def do():
-            upload = functools.partial(self.core.upload_file, fileDir=path)
-            ext = os.path.splitext(path)[1].lower()
-
-            if ext in ('.bmp', '.png', '.jpeg', '.jpg', '.gif'):
-                return upload(isPicture=True)
-            elif ext == '.mp4':
-                return upload(isVideo=True)
-            else:
-                return upload()
+            if self.uploader is not None:
+                return self.uploader.upload(path, kind, progress)
+            return self.core.upload_file(fileDir=path, isPicture=kind == 'pic', isVideo=kind == 'video')
 
         return do().get('MediaId')
 
+    def upload_file_async(self, path):
+        """
+        :meth:`upload_file` 的异步版本，需在事件循环中 await
+
+        :rtype: asyncio.Future
+        """
+        return self.async_runner.run_in_executor(self.upload_file, path)
+
     # messages / register
 
     def _process_message(self, msg):
@@ -442,19 +585,20 @@ class Bot(object):
 
         config = self.registered.get_config(msg)
 
-        logger.debug('{}: new message (func: {}):\n{}'.format(
-            self, config.func.__name__ if config else None, msg))
+        # 避免在未开启 DEBUG 日志时，仍为每条消息生成日志文本
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('{}: new message (func: {}):\n{}'.format(
+                self, config.func.__name__ if config else None, msg))
 
         if config:
 
-            def process():
-                # noinspection PyBroadException
-                try:
-                    ret = config.func(msg)
-                    if ret is not None:
+            def finish(ret):
+                if ret is not None:
+                    # noinspection PyBroadException
+                    try:
                         msg.reply(ret)
-                except:
-                    logger.exception('an error occurred in {}.'.format(config.func))
+                    except:
+                        logger.exception('an error occurred in {}.'.format(config.func))
 
                 if self.auto_mark_as_read and not msg.type == SYSTEM and msg.sender != self.self:
                     from wxpy import ResponseError
@@ -463,14 +607,41 @@ class Bot(object):
                     except ResponseError as e:
                         logger.warning('failed to mark as read: {}'.format(e))
 
-            if config.run_async:
-                start_new_thread(process, use_caller_name=True)
+            def process():
+                # noinspection PyBroadException
+                try:
+                    ret = config.func(msg)
+                except:
+                    logger.exception('an error occurred in {}.'.format(config.func))
+                    ret = None
+                finish(ret)
+
+            def coroutine_done(future):
+                # 在事件循环线程中执行，回复等堵塞操作交给 async_runner 的线程池
+                # (其队列不设上限，提交时不会堵塞事件循环，而 worker_pool 在队列满时可能堵塞)
+                # noinspection PyBroadException
+                try:
+                    ret = future.result()
+                except:
+                    logger.exception('an error occurred in {}.'.format(config.func))
+                    ret = None
+                if ret is not None or self.auto_mark_as_read:
+                    self.async_runner.executor.submit(finish, ret)
+
+            if is_coroutine_function(config.func):
+                # async def 定义的函数，在专用的事件循环中运行
+                self.async_runner.submit(config.func(msg), coroutine_done)
+            elif config.run_async and config.in_order:
+                # 同一聊天中的消息进入同一分片，按接收顺序依次处理
+                self.ordered_pool.submit(msg.chat.user_name, process)
+            elif config.run_async:
+                self.worker_pool.submit(process)
             else:
                 process()
 
     def register(
             self, chats=None, msg_types=None,
-            except_self=True, run_async=True, enabled=True
+            except_self=True, run_async=True, in_order=False, enabled=True
     ):
         """
         装饰器：用于注册消息配置
@@ -478,14 +649,15 @@ class Bot(object):
         :param chats: 消息所在的聊天对象：单个或列表形式的多个聊天对象或聊天类型，为空时匹配所有聊天对象
         :param msg_types: 消息的类型：单个或列表形式的多个消息类型，为空时匹配所有消息类型 (SYSTEM 类消息除外)
         :param except_self: 排除由自己发送的消息
-        :param run_async: 是否异步执行所配置的函数：可提高响应速度
+        :param run_async: 是否异步执行所配置的函数：可提高响应速度 (`async def` 定义的函数总是在 `bot.async_runner` 的事件循环中运行)
+        :param in_order: 异步执行时，是否按接收顺序依次处理同一聊天中的消息 (不同聊天之间仍并行处理)
         :param enabled: 当前配置的默认开启状态，可事后动态开启或关闭
         """
 
         def do_register(func):
             self.registered.append(MessageConfig(
                 bot=self, func=func, chats=chats, msg_types=msg_types,
-                except_self=except_self, run_async=run_async, enabled=enabled
+                except_self=except_self, run_async=run_async, in_order=in_order, enabled=enabled
             ))
 
             return func
@@ -498,14 +670,25 @@ class Bot(object):
             logger.info('{}: started'.format(self))
             self.is_listening = True
 
+            msg_list = self.core.msgList
+
             while self.alive and self.is_listening:
 
-                try:
-                    msg = Message(self.core.msgList.get(timeout=0.5), self)
-                except queue.Empty:
+                # 堵塞直到收到消息，或被 _wake_up_listener() 唤醒
+                raw = msg_list.get()
+                if raw is _WAKE_UP:
                     continue
 
-                if msg.type != SYSTEM:
+                msg = Message(raw, self)
+
+                if msg.type == SYSTEM:
+                    # itchat 更新本地联系人后，会发出 SystemInfo 为 'chatrooms' 的系统消息
+                    system_info = msg.raw.get('SystemInfo')
+                    if system_info == 'chatrooms':
+                        self.chat_index.invalidate(ensure_list(msg.raw.get('Text')))
+                    elif system_info == 'uins':
+                        self.chat_index.invalidate()
+                else:
                     self.messages.append(msg)
 
                 # noinspection PyBroadException
@@ -536,10 +719,17 @@ class Bot(object):
 
         if self.is_listening:
             self.is_listening = False
+            self._wake_up_listener()
             self.listening_thread.join()
         else:
             logger.warning('{} is not running.'.format(self))
 
+    def _wake_up_listener(self):
+        # 唤醒监听线程，使其重新检查 alive 和 is_listening (多余的唤醒标记会被直接跳过)
+        listening_thread = getattr(self, 'listening_thread', None)
+        if listening_thread and listening_thread.is_alive():
+            self.core.msgList.put(_WAKE_UP)
+
     def join(self):
         """
         堵塞进程，直到结束消息监听 (例如，机器人被登出时)
@@ -557,4 +747,5 @@ class Bot(object):
             self.stop()
         if self.alive and self.core.useHotReload:
             self.dump_login_status()
+        self.async_runner.stop()
         self.temp_dir.cleanup()
@@ -10,7 +10,8 @@ from functools import partial, wraps
 from wxpy.api.consts import ATTACHMENT, PICTURE, TEXT, VIDEO
 from wxpy.compatible import *
 from wxpy.compatible.utils import force_encoded_string_output
-from wxpy.utils import handle_response
+from wxpy.exceptions import ResponseError
+from wxpy.utils import handle_response, is_invalid_media_error, queued, upload_kind
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +19,12 @@ logger = logging.getLogger(__name__)
 def wrapped_send(msg_type):
     """
     send() 系列方法较为雷同，因此采用装饰器方式完成发送，并返回 SentMessage 对象
+
+    若机器人启用了发送队列 (:meth:`Bot.enable_send_queue`)，则放入队列，并返回 SentMessage 的 Future
     """
 
     def decorator(func):
+        @queued('text' if msg_type in (TEXT, None) else 'media')
         @wraps(func)
         def wrapped(self, *args, **kwargs):
 
@@ -47,11 +51,38 @@ def wrapped_send(msg_type):
                     sent_attrs_from_method.get('text') or sent_attrs_from_method.get('path')
                 ))
 
+                # 按文件内容查找缓存的 media_id，以省略上传 (未缓存时上传，若启用了 bot.uploader，则由其分块上传)
+                media_cache = self.bot.media_cache
+                path = itchat_call_or_ret.get('fileDir')
+                kind = upload_kind(path, msg_type) if path else None
+                from_cache = False
+                if kind and path and not itchat_call_or_ret.get('mediaId'):
+                    if media_cache is not None:
+                        itchat_call_or_ret['mediaId'], from_cache = media_cache.get_or_upload(
+                            path, kind, self.bot._upload_media)
+                    elif self.bot.uploader is not None:
+                        # 使用 bot.uploader 分块上传，而非 itchat 的上传方式
+                        itchat_call_or_ret['mediaId'] = self.bot._upload_media(path, kind)
+
                 @handle_response()
                 def do_send():
                     return itchat_partial_func(**itchat_call_or_ret)
 
-                ret = do_send()
+                try:
+                    ret = do_send()
+                except ResponseError as e:
+                    # 频率限制等与文件无关的错误直接抛出，避免额外的上传和发送
+                    if not from_cache or not is_invalid_media_error(e):
+                        raise
+                    # 缓存的 media_id 可能已失效，重新上传后再试一次
+                    logger.warning('failed to send with cached media_id, uploading again: {}'.format(path))
+                    media_cache.invalidate(path, kind)
+                    itchat_call_or_ret['mediaId'] = media_cache.get_or_upload(
+                        path, kind, self.bot._upload_media)[0]
+                    ret = do_send()
+
+                if itchat_call_or_ret.get('mediaId'):
+                    sent_attrs_from_method['media_id'] = itchat_call_or_ret['mediaId']
             else:
                 # send_raw_msg 会直接返回结果
                 ret = itchat_call_or_ret
@@ -178,8 +209,6 @@ class Chat(object):
 
         return dict(msg=msg), dict(text=msg)
 
-    # Todo: 发送后可获取到 media_id
-
     @wrapped_send(PICTURE)
     def send_image(self, path, media_id=None):
         """
@@ -190,7 +219,7 @@ class Chat(object):
         :rtype: :class:`wxpy.SentMessage`
         """
 
-        return dict(fileDir=path, mediaId=media_id), locals()
+        return dict(fileDir=path, mediaId=media_id), dict(path=path, media_id=media_id)
 
     @wrapped_send(ATTACHMENT)
     def send_file(self, path, media_id=None):
@@ -202,7 +231,7 @@ class Chat(object):
         :rtype: :class:`wxpy.SentMessage`
         """
 
-        return dict(fileDir=path, mediaId=media_id), locals()
+        return dict(fileDir=path, mediaId=media_id), dict(path=path, media_id=media_id)
 
     @wrapped_send(VIDEO)
     def send_video(self, path=None, media_id=None):
@@ -214,7 +243,7 @@ class Chat(object):
         :rtype: :class:`wxpy.SentMessage`
         """
 
-        return dict(fileDir=path, mediaId=media_id), locals()
+        return dict(fileDir=path, mediaId=media_id), dict(path=path, media_id=media_id)
 
     @wrapped_send(None)
     def send_raw_msg(self, raw_type, raw_content, uri=None, msg_ext=None):
@@ -266,6 +295,55 @@ class Chat(object):
             'msg_ext': msg_ext,
         }
 
+    # 以下方法用于 `async def` 定义的消息处理函数中，由 `bot.async_runner` 的线程池执行，返回可 await 的对象
+
+    def send_async(self, content=None, media_id=None):
+        """
+        :meth:`send` 的异步版本，需在事件循环中 await
+
+        ::
+
+            @bot.register()
+            async def reply_later(msg):
+                await asyncio.sleep(10)
+                await msg.chat.send_async('10 秒前收到了你的消息')
+
+        :rtype: asyncio.Future
+        """
+        return self.bot.async_runner.run_in_executor(self.send, content, media_id)
+
+    def send_msg_async(self, msg=None):
+        """
+        :meth:`send_msg` 的异步版本，需在事件循环中 await
+
+        :rtype: asyncio.Future
+        """
+        return self.bot.async_runner.run_in_executor(self.send_msg, msg)
+
+    def send_image_async(self, path, media_id=None):
+        """
+        :meth:`send_image` 的异步版本，需在事件循环中 await
+
+        :rtype: asyncio.Future
+        """
+        return self.bot.async_runner.run_in_executor(self.send_image, path, media_id)
+
+    def send_file_async(self, path, media_id=None):
+        """
+        :meth:`send_file` 的异步版本，需在事件循环中 await
+
+        :rtype: asyncio.Future
+        """
+        return self.bot.async_runner.run_in_executor(self.send_file, path, media_id)
+
+    def send_video_async(self, path=None, media_id=None):
+        """
+        :meth:`send_video` 的异步版本，需在事件循环中 await
+
+        :rtype: asyncio.Future
+        """
+        return self.bot.async_runner.run_in_executor(self.send_video, path, media_id)
+
     @handle_response()
     def mark_as_read(self):
         """
@@ -392,3 +470,12 @@ class Chat(object):
 
     def __hash__(self):
         return hash((Chat, self.user_name))
+
+    @staticmethod
+    def _hashes_by_user_name(obj):
+        """
+        判断对象是否为未重写 __hash__ 的聊天对象，即与 :meth:`__eq__` 一致，user_name 相同即视为相同
+
+        此时可通过 user_name 查找，以代替逐个比较
+        """
+        return isinstance(obj, Chat) and type(obj).__hash__ == Chat.__hash__
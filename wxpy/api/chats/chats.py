@@ -5,13 +5,14 @@ import logging
 import time
 from collections import Counter
 
-from wxpy.utils import match_attributes, match_name
+from wxpy.utils import InvalidatingList, match_attributes, match_name
+from .chat import Chat
 from wxpy.compatible import *
 
 logger = logging.getLogger(__name__)
 
 
-class Chats(list):
+class Chats(InvalidatingList):
     """
     多个聊天对象的合集，可用于搜索或统计
     """
@@ -21,6 +22,21 @@ class Chats(list):
             super(Chats, self).__init__(chat_list)
         self.source = source
 
+        # 与当前内容完全对应的搜索索引 (wxpy.utils.SearchIndex)，当合集被修改时失效
+        self._search_index = None
+        # 与当前内容完全对应的 user_name 集合 (或以 user_name 为键的字典)，用于快速判断是否包含某个聊天对象
+        self._user_names = None
+
+    def _invalidate(self):
+        # 修改合集内容后，搜索索引和 user_name 集合均失效
+        self._search_index = None
+        self._user_names = None
+
+    def __contains__(self, item):
+        if self._user_names is not None and Chat._hashes_by_user_name(item):
+            return item.user_name in self._user_names
+        return super(Chats, self).__contains__(item)
+
     def __add__(self, other):
         return Chats(super(Chats, self).__add__(other or list()))
 
@@ -47,7 +63,13 @@ class Chats(list):
                 return
             return True
 
-        return Chats(filter(match, self), self.source)
+        if self._search_index and (keywords or attributes):
+            # 先通过名称和属性索引找到候选对象，再逐一确认
+            candidates = self._search_index.candidates(keywords, **attributes)
+        else:
+            candidates = self
+
+        return Chats(filter(match, candidates), self.source)
 
     def stats(self, attribs=('sex', 'province', 'city')):
         """
@@ -64,7 +86,8 @@ class Chats(list):
         attribs = ensure_list(attribs)
         ret = dict()
         for attr in attribs:
-            ret[attr] = attr_stat(self, attr)
+            counts = self._search_index.attribute_counts(attr) if self._search_index else None
+            ret[attr] = attr_stat(self, attr) if counts is None else counts
         return ret
 
     def stats_text(self, total=True, sex=True, top_provinces=10, top_cities=10):
@@ -152,3 +175,39 @@ class Chats(list):
             logger.info('Waiting for {} seconds'.format(interval))
             if to_add:
                 time.sleep(interval)
+
+    def send_all(self, content=None, media_id=None, workers=5, limit=None, progress=None, checkpoint=None):
+        """
+        向合集中的所有聊天对象群发同一条消息
+
+        * 图片、视频和文件仅上传一次
+        * 由多个线程同时发送，并控制总体的发送频率 (若已启用 :meth:`发送队列 <Bot.enable_send_queue>`，则由其控制)
+        * 单个聊天对象发送失败时不会中断群发，失败的聊天对象和异常记录在返回结果中
+
+        ::
+
+            def show_progress(done, total, chat, error):
+                print('{}/{} {} {}'.format(done, total, chat, error or 'OK'))
+
+            # 中断后使用同一个断点文件再次调用，将跳过已发送的好友
+            result = bot.friends().send_all(
+                '@img@notice.png', progress=show_progress, checkpoint='notice.txt')
+            # <BroadcastResult: 1998 sent, 2 failed, 0 skipped>
+
+        ..  tip:: 断点文件中以 puid 记录已发送的聊天对象，若未启用 puid，则为仅在本次登陆中有效的 user_name
+
+        :param content: 消息内容，格式与 :meth:`Chat.send` 相同 (例如 '@img@' 前缀表示图片)
+        :param media_id: 图片、视频或文件的 media_id，填写后可省略上传
+        :param workers: 同时发送的线程数量
+        :param limit: 发送频率 (次数, 周期秒数)，默认与发送队列中该类消息的默认限制相同
+        :param progress: 进度回调，每完成一个聊天对象调用一次，接收参数: 已完成数量, 总数, 聊天对象, 异常 (成功时为 None)
+        :param checkpoint: 断点文件的路径
+        :return: 群发结果，包含 sent (已发送), failed (失败的聊天对象 -> 异常), skipped (已跳过) 三个属性
+        :rtype: :class:`wxpy.utils.BroadcastResult`
+        """
+
+        from wxpy.utils import broadcast
+        return broadcast(
+            self, content=content, media_id=media_id, workers=workers,
+            limit=limit, progress=progress, checkpoint=checkpoint
+        )
@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 
 import logging
 
-from wxpy.utils import ensure_list, get_user_name, handle_response, wrap_user_name
+from wxpy.utils import SearchIndex, ensure_list, get_user_name, handle_response, wrap_user_name
 from .chat import Chat
 from .chats import Chats
 from .member import Member
@@ -19,36 +19,81 @@ class Group(Chat):
     def __init__(self, raw, bot):
         super(Group, self).__init__(raw, bot)
 
+        # (原始 MemberList, 其长度, 成员列表, user_name -> 成员, 搜索索引)
+        self._member_cache = None
+
+    def _member_index(self):
+        """
+        获取群成员的缓存 (成员列表, user_name -> 成员, 搜索索引)，仅当 MemberList 发生变化时重建
+        """
+
+        raw_member_list = self.raw.get('MemberList')
+        if not raw_member_list:
+            self.update_group()
+            raw_member_list = self.raw.get('MemberList') or list()
+
+        cache = self._member_cache
+
+        if cache and cache[0] is raw_member_list and cache[1] == len(raw_member_list):
+            return cache[2:]
+
+        old_index = cache[3] if cache else dict()
+        member_list = list()
+        index = dict()
+
+        for raw in raw_member_list:
+            user_name = raw.get('UserName')
+            member = old_index.get(user_name)
+            if member is None:
+                member = Member(raw, self)
+            elif member.raw is not raw:
+                member.raw = raw
+            member_list.append(member)
+            index[user_name] = member
+
+        cache = raw_member_list, len(raw_member_list), member_list, index, SearchIndex(member_list)
+        self._member_cache = cache
+        return cache[2:]
+
+    def _reset_member_index(self):
+        """
+        使群成员的缓存失效，将在下次使用时重建 (但会复用已有的成员对象)
+        """
+        cache = self._member_cache
+        if cache:
+            self._member_cache = None, 0, cache[2], cache[3], cache[4]
+
+    def _get_member(self, user_name):
+        """
+        通过 user_name 找到对应的群成员
+
+        :param user_name: user_name
+        :return: 找到的群成员，或 None
+        """
+        return self._member_index()[1].get(user_name)
+
     @property
     def members(self):
         """
         群聊的成员列表
         """
 
-        def raw_member_list(update=False):
-            if update:
-                self.update_group()
-            return self.raw.get('MemberList', list())
-
-        ret = Chats(source=self)
-        ret.extend(map(
-            lambda x: Member(x, self),
-            raw_member_list() or raw_member_list(True)
-        ))
+        member_list, index, search_index = self._member_index()
+        ret = Chats(member_list, source=self)
+        ret._user_names = index
+        if self.bot.indexed_search:
+            ret._search_index = search_index
         return ret
 
     def __contains__(self, user):
-        user_name = get_user_name(user)
-        for member in self.members:
-            if member.user_name == user_name:
-                return member
+        return self._get_member(get_user_name(user))
 
     def __iter__(self):
-        for member in self.members:
+        for member in self._member_index()[0]:
             yield member
 
     def __len__(self):
-        return len(self.members)
+        return len(self._member_index()[0])
 
     def search(self, keywords=None, **attributes):
         """
@@ -73,11 +118,11 @@ class Group(Chat):
         """
         owner_user_name = self.raw.get('ChatRoomOwner')
         if owner_user_name:
-            for member in self:
-                if member.user_name == owner_user_name:
-                    return member
-        elif self.members:
-            return self.members[0]
+            return self._get_member(owner_user_name)
+        else:
+            member_list = self._member_index()[0]
+            if member_list:
+                return member_list[0]
 
     @property
     def is_owner(self):
@@ -91,10 +136,7 @@ class Group(Chat):
         """
         机器人自身 (作为群成员)
         """
-        for member in self.members:
-            if member == self.bot.self:
-                return member
-        return Member(self.bot.core.loginInfo['User'], self)
+        return self._get_member(self.bot.self.user_name) or Member(self.bot.core.loginInfo['User'], self)
 
     def update_group(self, members_details=False):
         """
@@ -110,6 +152,10 @@ class Group(Chat):
             return self.bot.core.update_chatroom(self.user_name, members_details)
 
         super(Group, self).__init__(do(), self.bot)
+        self._reset_member_index()
+
+        # 使 bot.groups() 中的同一群聊对象重新指向 itchat 中已更新的原始数据
+        self.bot.chat_index.invalidate()
 
     @handle_response()
     def add_members(self, users, use_invitation=False):
@@ -10,35 +10,17 @@ class Groups(list):
     群聊的合集，可用于按条件搜索
     """
 
-    # 记录已知的 shadow group 和 valid group
-    # shadow group 直接抛弃
-    # valid group 直接通过
-    # 其他的需要确认是否包含机器人自身，并再分类到上面两种群中
-
-    shadow_group_user_names = list()
-    valid_group_user_names = list()
-
     def __init__(self, group_list=None):
         if group_list:
             # Web 微信服务端似乎有个 BUG，会返回不存在的群
             # 具体表现为: 名称为先前退出的群，但成员列表却完全陌生
             # 因此加一个保护逻辑: 只返回"包含自己的群"
+            # 分类结果由各个机器人的 chat_index 保存，详见 wxpy.utils.chat_index
 
-            groups_to_init = list()
-
-            for group in group_list:
-                if group.user_name in Groups.shadow_group_user_names:
-                    continue
-                elif group.user_name in Groups.valid_group_user_names:
-                    groups_to_init.append(group)
-                else:
-                    if group.bot.self in group:
-                        Groups.valid_group_user_names.append(group.user_name)
-                        groups_to_init.append(group)
-                    else:
-                        Groups.shadow_group_user_names.append(group.user_name)
-
-            super(Groups, self).__init__(groups_to_init)
+            super(Groups, self).__init__(filter(
+                lambda group: group.bot.chat_index.is_valid_group(group),
+                group_list
+            ))
 
     def search(self, keywords=None, users=None, **attributes):
         """
@@ -57,13 +39,18 @@ class Groups(list):
                 if not isinstance(user, User):
                     raise TypeError('expected `User`, got {} (type: {})'.format(user, type(user)))
 
+        # 各个机器人中，同时包含所有 users 的群聊 user_name 集合
+        groups_with_users = dict()
+
         def match(group):
             if not match_name(group, keywords):
                 return
             if users:
-                for _user in users:
-                    if _user not in group:
-                        return
+                chat_index = group.bot.chat_index
+                if chat_index not in groups_with_users:
+                    groups_with_users[chat_index] = chat_index.groups_with_users(self, users)
+                if group.user_name not in groups_with_users[chat_index]:
+                    return
             if not match_attributes(group, **attributes):
                 return
             return True
@@ -1,6 +1,8 @@
 # coding: utf-8
 from __future__ import unicode_literals
 
+import weakref
+
 from .user import User
 
 
@@ -14,14 +16,24 @@ class Member(User):
 
     def __init__(self, raw, group):
         super(Member, self).__init__(raw, group.bot)
+        self._group_ref = weakref.ref(group)
         self._group_user_name = group.user_name
 
     @property
     def group(self):
-        for _group in self.bot.groups():
-            if _group.user_name == self._group_user_name:
-                return _group
-        raise Exception('failed to find the group belong to')
+        """
+        该成员所在的群聊
+        """
+
+        _group = self._group_ref()
+        if _group is None:
+            # 原群聊对象已被回收时，通过索引重新找到该群聊
+            from .group import Group
+            _group = self.bot.chat_index.get(self._group_user_name)
+            if not isinstance(_group, Group):
+                raise Exception('failed to find the group belong to')
+            self._group_ref = weakref.ref(_group)
+        return _group
 
     @property
     def display_name(self):
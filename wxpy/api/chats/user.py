@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 
 import logging
 
-from wxpy.utils import handle_response
+from wxpy.utils import handle_response, queued
 from .chat import Chat
 
 logger = logging.getLogger(__name__)
@@ -24,6 +24,7 @@ class User(Chat):
         """
         return self.raw.get('RemarkName')
 
+    @queued('remark')
     @handle_response()
     def set_remark_name(self, remark_name):
         """
@@ -34,7 +35,11 @@ class User(Chat):
 
         logger.info('setting remark name for {}: {}'.format(self, remark_name))
 
-        return self.bot.core.set_alias(userName=self.user_name, alias=remark_name)
+        try:
+            return self.bot.core.set_alias(userName=self.user_name, alias=remark_name)
+        finally:
+            # itchat 会原地修改本地的备注名称，需要重建名称索引
+            self.bot.chat_index.invalidate()
 
     @property
     def sex(self):
@@ -79,12 +84,8 @@ class User(Chat):
         :return: 若为好友关系，返回对应的好友，否则返回 False
         """
         if self.bot:
-            try:
-                friends = self.bot.friends()
-                index = friends.index(self)
-                return friends[index]
-            except ValueError:
-                return False
+            from .friend import Friend
+            return self.bot.chat_index.storage_chat('memberList', Friend, self.user_name) or False
 
     def add(self, verify_content=''):
         """
@@ -27,6 +27,25 @@ from ...compatible import *
 logger = logging.getLogger(__name__)
 
 
+def _lazy_property(func):
+    """
+    仅在首次访问时计算的属性，计算结果保存在 `_<属性名>` 中
+    """
+
+    name = '_' + func.__name__
+
+    def getter(self):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            ret = func(self)
+            setattr(self, name, ret)
+            return ret
+
+    getter.__name__ = func.__name__
+    return property(getter, doc=func.__doc__)
+
+
 class Message(object):
     """
     单条消息对象，包括:
@@ -38,15 +57,20 @@ class Message(object):
     | 此类消息请参见 :class:`SentMessage`
     """
 
+    # 不使用 __dict__，以减少大量历史消息的内存占用
+    # 以下划线开头的属性为 _lazy_property 的计算结果
+    __slots__ = (
+        'raw', 'bot', '_receive_time',
+        '_chat', '_sender', '_receiver', '_member', '_card', '_articles', '_location',
+    )
+
     def __init__(self, raw, bot):
         self.raw = raw
         self.bot = weakref.proxy(bot)
 
         self._receive_time = datetime.now()
 
-        # 将 msg.chat.send* 方法绑定到 msg.reply*，例如 msg.chat.send_img => msg.reply_img
-        for method in '', '_image', '_file', '_video', '_msg', '_raw_msg':
-            setattr(self, 'reply' + method, getattr(self.chat, 'send' + method))
+        # chat, sender, receiver 等属性将在首次访问时再计算
 
     def __hash__(self):
         return hash((Message, self.id))
@@ -137,6 +161,14 @@ class Message(object):
         else:
             raise ValueError('download method not found, or invalid message type')
 
+    def get_file_async(self, save_path=None):
+        """
+        :meth:`get_file` 的异步版本，需在事件循环中 await
+
+        :rtype: asyncio.Future
+        """
+        return self.bot.async_runner.run_in_executor(self.get_file, save_path)
+
     @property
     def file_name(self):
         """
@@ -208,7 +240,7 @@ class Message(object):
 
         return _url
 
-    @property
+    @_lazy_property
     def articles(self):
         """
         公众号推送中的文章列表 (首篇的 标题/地址 与消息中的 text/url 相同)
@@ -244,7 +276,7 @@ class Message(object):
 
             return article_list
 
-    @property
+    @_lazy_property
     def card(self):
         """
         * 好友请求中的请求用户
@@ -282,7 +314,7 @@ class Message(object):
         if create_time:
             return (self.receive_time - create_time).total_seconds()
 
-    @property
+    @_lazy_property
     def location(self):
         """
         位置消息中的地理位置信息
@@ -302,7 +334,7 @@ class Message(object):
 
     # chats
 
-    @property
+    @_lazy_property
     def chat(self):
         """
         消息所在的聊天会话，即:
@@ -318,7 +350,7 @@ class Message(object):
         else:
             return self.sender
 
-    @property
+    @_lazy_property
     def sender(self):
         """
         消息的发送者
@@ -328,7 +360,7 @@ class Message(object):
 
         return self._get_chat_by_user_name(self.raw.get('FromUserName'))
 
-    @property
+    @_lazy_property
     def receiver(self):
         """
         消息的接收者
@@ -338,7 +370,7 @@ class Message(object):
 
         return self._get_chat_by_user_name(self.raw.get('ToUserName'))
 
-    @property
+    @_lazy_property
     def member(self):
         """
         * 若消息来自群聊，则此属性为消息的实际发送人(具体的群成员)
@@ -347,18 +379,58 @@ class Message(object):
         :rtype: NoneType, :class:`wxpy.Member`
         """
 
-        if isinstance(self.chat, Group):
+        _chat = self.chat
+        if isinstance(_chat, Group):
             if self.sender == self.bot.self:
-                return self.chat.self
+                return _chat.self
             else:
                 actual_user_name = self.raw.get('ActualUserName')
-                for _member in self.chat.members:
-                    if _member.user_name == actual_user_name:
-                        return _member
+                # noinspection PyProtectedMember
+                _member = _chat._get_member(actual_user_name)
+                if _member:
+                    return _member
                 return Member(dict(
                     UserName=actual_user_name,
                     NickName=self.raw.get('ActualNickName')
-                ), self.chat)
+                ), _chat)
+
+    # reply
+
+    def reply(self, *args, **kwargs):
+        """
+        等同于 Message.chat.send(...)
+        """
+        return self.chat.send(*args, **kwargs)
+
+    def reply_image(self, *args, **kwargs):
+        """
+        等同于 Message.chat.send_image(...)
+        """
+        return self.chat.send_image(*args, **kwargs)
+
+    def reply_file(self, *args, **kwargs):
+        """
+        等同于 Message.chat.send_file(...)
+        """
+        return self.chat.send_file(*args, **kwargs)
+
+    def reply_video(self, *args, **kwargs):
+        """
+        等同于 Message.chat.send_video(...)
+        """
+        return self.chat.send_video(*args, **kwargs)
+
+    def reply_msg(self, *args, **kwargs):
+        """
+        等同于 Message.chat.send_msg(...)
+        """
+        return self.chat.send_msg(*args, **kwargs)
+
+    def reply_raw_msg(self, *args, **kwargs):
+        """
+        等同于 Message.chat.send_raw_msg(...)
+        """
+        return self.chat.send_raw_msg(*args, **kwargs)
 
     def _get_chat_by_user_name(self, user_name):
         """
@@ -368,19 +440,7 @@ class Message(object):
         :return: 找到的对应聊天对象
         """
 
-        def match_in_chats(_chats):
-            for c in _chats:
-                if c.user_name == user_name:
-                    return c
-
-        _chat = None
-
-        if user_name.startswith('@@'):
-            _chat = match_in_chats(self.bot.groups())
-        elif user_name:
-            _chat = match_in_chats(self.bot.friends())
-            if not _chat:
-                _chat = match_in_chats(self.bot.mps())
+        _chat = self.bot.chat_index.get(user_name)
 
         if not _chat:
             _chat = Chat(wrap_user_name(user_name), self.bot)
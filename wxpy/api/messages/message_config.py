@@ -5,11 +5,26 @@ import logging
 import weakref
 
 from wxpy.compatible.utils import force_encoded_string_output
-from wxpy.utils import ensure_list
+from wxpy.utils import InvalidatingList, ensure_list
 
 logger = logging.getLogger(__name__)
 
 
+class _ConfigList(InvalidatingList):
+    """
+    配置中的聊天对象或消息类型列表，修改后使注册配置的查找表失效
+    """
+
+    def __init__(self, items, config):
+        super(_ConfigList, self).__init__(items)
+        self._config = weakref.ref(config)
+
+    def _invalidate(self):
+        config = self._config()
+        if config is not None:
+            config._invalidate()
+
+
 class MessageConfig(object):
     """
     单个消息注册配置
@@ -18,19 +33,62 @@ class MessageConfig(object):
     def __init__(
             self, bot, func,
             chats, msg_types, except_self,
-            run_async, enabled
+            run_async, enabled, in_order=False
     ):
         self.bot = weakref.proxy(bot)
         self.func = func
 
-        self.chats = ensure_list(chats)
-        self.msg_types = ensure_list(msg_types)
+        self._chats = None
+        self._msg_types = None
+        self.chats = chats
+        self.msg_types = msg_types
         self.except_self = except_self
 
         self.run_async = run_async
+        self.in_order = in_order
         self._enabled = None
         self.enabled = enabled
 
+    def _wrap(self, value):
+        value = ensure_list(value)
+        if isinstance(value, (list, tuple)):
+            return _ConfigList(value, self)
+        return value
+
+    def _invalidate(self):
+        # 聊天对象或消息类型被修改后，所属机器人的注册配置查找表失效
+        try:
+            registered = self.bot.registered
+        except (AttributeError, ReferenceError):
+            return
+        registered._invalidate()
+
+    @property
+    def chats(self):
+        """
+        | 配置的聊天对象，为 None 时匹配所有聊天对象
+        | 可重新赋值或直接修改，均在下一条消息生效 (赋值时的列表会被复制，此后修改原列表不会影响配置)
+        """
+        return self._chats
+
+    @chats.setter
+    def chats(self, value):
+        self._chats = self._wrap(value)
+        self._invalidate()
+
+    @property
+    def msg_types(self):
+        """
+        | 配置的消息类型，为 None 时匹配所有消息类型 (SYSTEM 类消息除外)
+        | 可重新赋值或直接修改，均在下一条消息生效 (赋值时的列表会被复制，此后修改原列表不会影响配置)
+        """
+        return self._msg_types
+
+    @msg_types.setter
+    def msg_types(self, value):
+        self._msg_types = self._wrap(value)
+        self._invalidate()
+
     @property
     def enabled(self):
         """
@@ -48,19 +106,21 @@ class MessageConfig(object):
 
     @force_encoded_string_output
     def __repr__(self):
-        return '<{}: {}: {} ({}{})>'.format(
+        return '<{}: {}: {} ({}{}{})>'.format(
             self.__class__.__name__,
             self.bot.self.name,
             self.func.__name__,
             'Enabled' if self.enabled else 'Disabled',
             ', Async' if self.run_async else '',
+            ', In order' if self.run_async and self.in_order else '',
         )
 
     def __unicode__(self):
-        return '<{}: {}: {} ({}{})>'.format(
+        return '<{}: {}: {} ({}{}{})>'.format(
             self.__class__.__name__,
             self.bot.self.name,
             self.func.__name__,
             'Enabled' if self.enabled else 'Disabled',
             ', Async' if self.run_async else '',
+            ', In order' if self.run_async and self.in_order else '',
         )
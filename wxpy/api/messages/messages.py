@@ -1,29 +1,165 @@
 # coding: utf-8
 from __future__ import unicode_literals
+
 import threading
 
-from wxpy.utils import match_attributes, match_text
+try:
+    from collections.abc import Sequence
+except ImportError:
+    # Python 2.6-2.7
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from collections import Sequence
+
+from wxpy.utils import MessageIndex, MessageTextIndex, get_user_name, match_attributes, match_text, to_timestamp
+from wxpy.compatible import *
 
 
-class Messages(list):
+class Messages(Sequence):
     """
     多条消息的合集，可用于记录或搜索
+
+    | 以环形缓冲区的方式保存最后的 `max_history` 条消息，无论历史消息的数量多少，加入新消息均为常数时间
+    | 支持与列表相同的索引、切片、迭代，以及 `len()` 和 `in` 操作
     """
 
     def __init__(self, msg_list=None, max_history=200):
-        if msg_list:
-            super(Messages, self).__init__(msg_list)
-        self.max_history = max_history
+        # 环形缓冲区: 在 _items 已满时，新消息覆盖位于 _start 的最旧消息
+        self._items = list(msg_list) if msg_list else list()
+        self._start = 0
+        self._max_history = max_history
         self._thread_lock = threading.Lock()
 
+        # 二级索引 (wxpy.utils.MessageIndex)，在首次调用 query() 时建立，此后随消息的加入和移出增量更新
+        self._index = None
+        # 文本倒排索引 (wxpy.utils.MessageTextIndex)，仅在开启 indexed_search 后建立
+        self._text_index = None
+
+        # 消息存档 (wxpy.utils.MessageArchive)，加入的消息都会被存档，不受 max_history 的限制
+        self.archive = None
+
+    @property
+    def max_history(self):
+        """
+        最大保存条数，即：仅保存最后的 n 条消息 (不为正整数时，将不再保存新的消息)
+        """
+        return self._max_history
+
+    @max_history.setter
+    def max_history(self, value):
+        with self._thread_lock:
+            self._max_history = value
+            if self._is_capped():
+                self._remove_oldest(len(self._items) - value)
+                self._items = self._snapshot()[-value:]
+                self._start = 0
+
+    @property
+    def indexed_search(self):
+        """
+        是否使用文本倒排索引来加速 :meth:`search` 中的关键词匹配，默认为 False
+
+        | 开启后，每条加入的消息都会被立即索引，适合保存大量历史消息，且经常按关键词搜索的场景
+        | 搜索结果与不使用索引时完全一致
+        """
+        return self._text_index is not None
+
+    @indexed_search.setter
+    def indexed_search(self, value):
+        with self._thread_lock:
+            if not value:
+                self._text_index = None
+            elif self._text_index is None:
+                self._text_index = MessageTextIndex(self._snapshot())
+
+    def _is_capped(self):
+        return isinstance(self._max_history, int) and self._max_history > 0
+
+    def _remove_oldest(self, count):
+        # 将最旧的 count 条消息移出索引 (需在锁内调用)
+        for index in self._index, self._text_index:
+            if index is not None:
+                for _ in range(count):
+                    index.remove_oldest()
+
+    def _snapshot(self):
+        # 按时间顺序排列的消息列表 (需在锁内调用)
+        return self._items[self._start:] + self._items[:self._start]
+
     def append(self, msg):
         """
         仅当 self.max_history 为 int 类型，且大于 0 时才保存历史消息
+
+        若设置了 self.archive，无论是否保存，都会将消息放入存档队列
         """
+        if self.archive is not None:
+            self.archive.append(msg)
+
+        with self._thread_lock:
+            if not self._is_capped():
+                return
+
+            size = len(self._items)
+            if size < self._max_history:
+                self._items.append(msg)
+            elif size == self._max_history:
+                self._remove_oldest(1)
+                self._items[self._start] = msg
+                self._start = (self._start + 1) % size
+            else:
+                # 初始列表超出了 max_history
+                self._remove_oldest(size - self._max_history + 1)
+                self._items = self._snapshot()[size - self._max_history + 1:] + [msg]
+                self._start = 0
+
+            for index in self._index, self._text_index:
+                if index is not None:
+                    index.add(msg)
+
+    def extend(self, msgs):
+        for msg in msgs:
+            self.append(msg)
+
+    def clear(self):
+        with self._thread_lock:
+            self._items = list()
+            self._start = 0
+            self._index = None
+            if self._text_index is not None:
+                self._text_index = MessageTextIndex()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, item):
+        with self._thread_lock:
+            if isinstance(item, slice):
+                return Messages(self._snapshot()[item], max_history=self._max_history)
+
+            size = len(self._items)
+            if item < 0:
+                item += size
+            if not 0 <= item < size:
+                raise IndexError('list index out of range')
+            return self._items[(self._start + item) % size]
+
+    def __iter__(self):
         with self._thread_lock:
-            if isinstance(self.max_history, int) and self.max_history > 0:
-                del self[:-self.max_history + 1]
-                return super(Messages, self).append(msg)
+            snapshot = self._snapshot()
+        return iter(snapshot)
+
+    def __eq__(self, other):
+        if isinstance(other, (Messages, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        return ret if ret is NotImplemented else not ret
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
 
     def search(self, keywords=None, **attributes):
         """
@@ -42,4 +178,51 @@ class Messages(list):
                 return
             return True
 
-        return Messages(filter(match, self), max_history=self.max_history)
+        with self._thread_lock:
+            if self._text_index is not None and keywords:
+                # 先通过文本倒排索引找到候选消息，再逐一确认
+                candidates = self._text_index.candidates(keywords)
+            else:
+                candidates = self._snapshot()
+
+        return Messages(filter(match, candidates), max_history=self.max_history)
+
+    def query(self, chat=None, sender=None, member=None, msg_type=None, since=None, until=None, limit=None):
+        """
+        通过索引查询消息记录，比 :meth:`search` 更快，但仅支持以下条件 (均为可选)
+
+        ::
+
+            # 群聊中某位成员的最后 50 条消息
+            bot.messages.query(chat=group, member=member, limit=50)
+
+            # 最近一小时内，某个聊天中的图片消息
+            bot.messages.query(chat=chat, msg_type=PICTURE, since=datetime.now() - timedelta(hours=1))
+
+        :param chat: 消息所在的聊天会话 (聊天对象或 user_name)
+        :param sender: 消息的发送者 (聊天对象或 user_name)，注意群聊消息的发送者为群聊本身
+        :param member: 群聊消息的实际发送人 (群成员或 user_name)
+        :param msg_type: 消息类型，如 TEXT
+        :param since: 起始的消息创建时间 (datetime，含)
+        :param until: 结束的消息创建时间 (datetime，不含)
+        :param limit: 仅返回最后的 n 条消息
+        :return: 所有匹配的消息 (按加入顺序)
+        :rtype: :class:`wxpy.Messages`
+        """
+
+        chat, sender, member = [
+            None if x is None else get_user_name(x)
+            for x in (chat, sender, member)
+        ]
+        since, until = to_timestamp(since), to_timestamp(until)
+
+        with self._thread_lock:
+            if self._index is None:
+                self._index = MessageIndex(self._snapshot())
+
+            found = self._index.query(
+                chat=chat, sender=sender, member=member, msg_type=msg_type,
+                since=since, until=until, limit=limit
+            )
+
+        return Messages(found, max_history=self.max_history)
@@ -3,10 +3,12 @@ from __future__ import unicode_literals
 
 import weakref
 
+from wxpy.api.chats import Chat
 from wxpy.api.consts import SYSTEM
+from wxpy.utils import InvalidatingList
 
 
-class Registered(list):
+class Registered(InvalidatingList):
     def __init__(self, bot):
         """
         保存当前机器人所有已注册的消息配置
@@ -16,6 +18,48 @@ class Registered(list):
         super(Registered, self).__init__()
         self.bot = weakref.proxy(bot)
 
+        # 消息类型 -> 编译后的查找表，在注册配置列表被修改时清空
+        self._tables = dict()
+
+    def _invalidate(self):
+        # 修改注册配置列表后，编译后的查找表均失效
+        self._tables = dict()
+
+    def _compile(self, msg_type):
+        """
+        为给定的消息类型编译查找表，包含:
+
+        * user_name -> [(优先级, 配置), ...]: 注册了具体聊天对象的配置
+        * [(优先级, 配置, 类), ...]: 注册了聊天对象类的配置
+        * [(优先级, 配置), ...]: 未限定聊天对象的配置
+        * [(优先级, 配置, 对象), ...]: 其他需要逐个比较的对象
+
+        启用状态不会被编译，而是在查找时检查
+        """
+
+        by_user_name, by_class, any_chat, others = dict(), list(), list(), list()
+
+        for priority, conf in enumerate(self):
+            if conf.msg_types:
+                if msg_type not in conf.msg_types:
+                    continue
+            elif conf.msg_types is None and msg_type == SYSTEM:
+                continue
+
+            if conf.chats is None:
+                any_chat.append((priority, conf))
+                continue
+
+            for chat in conf.chats:
+                if isinstance(chat, type):
+                    by_class.append((priority, conf, chat))
+                elif Chat._hashes_by_user_name(chat):
+                    by_user_name.setdefault(chat.user_name, list()).append((priority, conf))
+                else:
+                    others.append((priority, conf, chat))
+
+        return by_user_name, by_class, any_chat, others
+
     def get_config(self, msg):
         """
         获取给定消息的注册配置。每条消息仅匹配一个注册配置，后注册的配置具有更高的匹配优先级。
@@ -24,22 +68,36 @@ class Registered(list):
         :return: 匹配的回复配置
         """
 
-        for conf in self[::-1]:
+        tables = self._tables
+        msg_type = msg.type
 
-            if not conf.enabled or (conf.except_self and msg.sender == self.bot.self):
-                continue
+        try:
+            table = tables[msg_type]
+        except KeyError:
+            table = tables[msg_type] = self._compile(msg_type)
+        except TypeError:
+            # 消息类型不可哈希
+            table = self._compile(msg_type)
 
-            if conf.msg_types and msg.type not in conf.msg_types:
-                continue
-            elif conf.msg_types is None and msg.type == SYSTEM:
-                continue
+        by_user_name, by_class, any_chat, others = table
 
-            if conf.chats is None:
-                return conf
+        chat = msg.chat
+        candidates = any_chat + by_user_name.get(chat.user_name, [])
+        candidates.extend((p, conf) for p, conf, cls in by_class if isinstance(chat, cls))
+        candidates.extend((p, conf) for p, conf, other in others if other == chat)
+        candidates.sort(key=lambda x: x[0], reverse=True)
 
-            for chat in conf.chats:
-                if (isinstance(chat, type) and isinstance(msg.chat, chat)) or chat == msg.chat:
-                    return conf
+        is_self = None
+
+        for _, conf in candidates:
+            if not conf.enabled:
+                continue
+            if conf.except_self:
+                if is_self is None:
+                    is_self = msg.sender == self.bot.self
+                if is_self:
+                    continue
+            return conf
 
     def get_config_by_func(self, func):
         """
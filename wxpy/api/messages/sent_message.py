@@ -16,42 +16,35 @@ class SentMessage(object):
     *使用程序发送的消息也将被记录到历史消息 bot.messages 中*
     """
 
-    def __init__(self, attributes):
-
+    # 不使用 __dict__，以减少大量历史消息的内存占用
+    __slots__ = (
         # 消息的类型 (仅可为 'Text', 'Picture', 'Video', 'Attachment')
-        self.type = None
-
+        'type',
         # 消息的服务端 ID
-        self.id = None
-
+        'id',
         # 消息的本地 ID (撤回时需要用到)
-        self.local_id = None
-
+        'local_id',
         # 消息的文本内容
-        self.text = None
-
+        'text',
         # 消息附件的本地路径
-        self.path = None
-
+        'path',
         # 消息的附件 media_id
-        self.media_id = None
-
+        'media_id',
         # 本地发送时间
-        self.create_time = None
-
+        'create_time',
         # 接收服务端响应时间
-        self.receive_time = None
-
-        self.receiver = None
-
+        'receive_time',
+        'receiver',
         # send_raw_msg 的各属性
-        self.raw_type = None
-        self.raw_content = None
-        self.uri = None
-        self.msg_ext = None
+        'raw_type',
+        'raw_content',
+        'uri',
+        'msg_ext',
+    )
 
-        for k, v in attributes.items():
-            setattr(self, k, v)
+    def __init__(self, attributes):
+        for name in self.__slots__:
+            setattr(self, name, attributes.get(name))
 
     def __hash__(self):
         return hash((SentMessage, self.id))
@@ -1,7 +1,18 @@
+from .async_runner import AsyncRunner, is_coroutine_function
 from .base_request import BaseRequest
+from .broadcast import BroadcastResult, broadcast
+from .chat_index import ChatIndex
 from .console import embed, shell_entry
+from .invalidating_list import InvalidatingList
 from .misc import decode_text_from_webwx, enhance_connection, enhance_webwx_request, ensure_list, get_receiver, \
     get_text_without_at_bot, get_user_name, handle_response, match_attributes, match_name, match_text, repr_message, \
     smart_map, start_new_thread, wrap_user_name
+from .message_archive import ArchivedMessage, MessageArchive
+from .media_cache import MediaCache, file_digest, is_invalid_media_error, upload_kind
+from .message_index import MessageIndex, MessageTextIndex, to_timestamp
 from .puid_map import PuidMap
+from .search_index import SearchIndex
+from .send_queue import SendQueue, TokenBucket, queued
 from .tools import detect_freq_limit, dont_raise_response_error, ensure_one, mutual_friends
+from .uploader import ChunkedUploader
+from .worker_pool import ShardedWorkerPool, WorkerPool
@@ -0,0 +1,152 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import inspect
+import logging
+import threading
+
+from .misc import start_new_thread
+
+logger = logging.getLogger(__name__)
+
+"""
+
+# async runner
+
+用于执行 `async def` 定义的消息处理函数 (需要 Python 3.5+)
+
+* 所有协程运行在同一个专用的事件循环中 (单个后台线程)，在首次提交协程时启动
+* 同时等待的协程数量不受线程数量的限制
+* 堵塞的操作 (如发送消息、上传和下载文件) 可通过 `run_in_executor()` 交给固定数量的线程执行，
+  在协程中以 await 等待结果，不会堵塞事件循环
+
+本模块不使用 async / await 语法，以保持 Python 2 下的兼容 (仅在实际使用时导入 asyncio)
+
+
+"""
+
+
+def is_coroutine_function(func):
+    """
+    判断函数是否为 `async def` 定义的协程函数 (Python 2 下总为 False)
+
+    :param func: 函数
+    """
+
+    # noinspection PyUnresolvedReferences
+    checker = getattr(inspect, 'iscoroutinefunction', None)
+    return bool(checker and checker(func))
+
+
+class AsyncRunner(object):
+    def __init__(self, executor_workers=20):
+        """
+        运行协程的专用事件循环，以及执行堵塞操作的线程池
+
+        :param executor_workers: 用于执行堵塞操作的最大线程数量
+        """
+
+        self.executor_workers = executor_workers
+
+        self._loop = None
+        self._executor = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, 'running' if self.is_running else 'stopped')
+
+    @property
+    def is_running(self):
+        """
+        事件循环是否正在运行
+        """
+        return bool(self._loop and self._loop.is_running())
+
+    @property
+    def loop(self):
+        """
+        专用的事件循环 (需要时自动启动)
+        """
+        self._ensure_loop()
+        return self._loop
+
+    @property
+    def executor(self):
+        """
+        执行堵塞操作的线程池 (concurrent.futures.ThreadPoolExecutor)
+        """
+        if self._executor is None:
+            with self._thread_lock:
+                if self._executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self._executor = ThreadPoolExecutor(self.executor_workers)
+        return self._executor
+
+    def _ensure_loop(self):
+        if self._thread is not None:
+            return
+
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+
+            import asyncio
+            self._loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(self._loop)
+                self._loop.call_soon(started.set)
+                self._loop.run_forever()
+
+            self._thread = start_new_thread(run_loop)
+            started.wait()
+
+    def submit(self, coro, callback=None):
+        """
+        在专用的事件循环中运行一个协程 (可在任意线程中调用)
+
+        :param coro: 协程对象
+        :param callback: 协程结束后的回调函数，将传入 concurrent.futures.Future 作为唯一参数 (在事件循环线程中执行)
+        :return: concurrent.futures.Future
+        """
+
+        import asyncio
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def run_in_executor(self, func, *args, **kwargs):
+        """
+        将堵塞的函数交给线程池执行，并返回可在当前事件循环中 await 的 asyncio.Future
+
+        ::
+
+            async def handler(msg):
+                text = await bot.async_runner.run_in_executor(query_database, msg.text)
+
+        :param func: 需要执行的函数
+        :param args: 位置参数
+        :param kwargs: 命名参数
+        :return: asyncio.Future
+        """
+
+        import asyncio
+        return asyncio.wrap_future(self.executor.submit(func, *args, **kwargs))
+
+    def stop(self):
+        """
+        停止事件循环 (未完成的协程将被放弃)，并关闭线程池
+        """
+
+        with self._thread_lock:
+            if self._thread is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = self._thread = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
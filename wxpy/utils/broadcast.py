@@ -0,0 +1,165 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import io
+import logging
+import os
+import re
+import threading
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+from .media_cache import upload_kind
+from .misc import start_new_thread
+from .send_queue import DEFAULT_LIMITS, MEDIA, TEXT, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+"""
+
+# broadcast
+
+向多个聊天对象群发同一条消息 (`Chats.send_all()`)
+
+* 图片、视频和文件仅上传一次，此后使用 media_id 发送
+* 由多个线程同时发送，并共用一个令牌桶控制总体频率 (若已启用发送队列，则由发送队列控制)
+* 每完成一个聊天对象，调用一次进度回调
+* 每成功发送一个聊天对象，即在断点文件中追加一行 (聊天对象的 puid 或 user_name)，
+  再次使用同一个断点文件时，将跳过其中已发送的聊天对象
+
+
+"""
+
+
+class BroadcastResult(object):
+    """
+    群发的结果
+    """
+
+    def __init__(self):
+        #: 本次成功发送的聊天对象列表
+        self.sent = list()
+        #: 发送失败的聊天对象 -> 异常
+        self.failed = dict()
+        #: 根据断点文件跳过的聊天对象列表
+        self.skipped = list()
+
+    def __repr__(self):
+        return '<{}: {} sent, {} failed, {} skipped>'.format(
+            self.__class__.__name__, len(self.sent), len(self.failed), len(self.skipped))
+
+
+def checkpoint_key(chat):
+    """
+    聊天对象在断点文件中的键: 若已启用 puid，则为 puid，否则为 user_name (仅在本次登陆中有效)
+    """
+
+    if chat.bot.puid_map:
+        return chat.puid
+    return chat.user_name
+
+
+def _load_checkpoint(path):
+    if not path or not os.path.isfile(path):
+        return set()
+    with io.open(path, encoding='utf-8') as fp:
+        return set(line.strip() for line in fp if line.strip())
+
+
+def broadcast(chats, content=None, media_id=None, workers=5, limit=None, progress=None, checkpoint=None):
+    """
+    向多个聊天对象群发同一条消息，详见 :meth:`Chats.send_all`
+    """
+
+    chats = list(chats)
+    result = BroadcastResult()
+
+    if not chats:
+        return result
+
+    bot = chats[0].bot
+    content = '' if content is None else '{}'.format(content)
+
+    matched = re.match(r'@(\w{3})@(.+)', content)
+    kind = matched and upload_kind(matched.group(2), matched.group(1))
+    is_media = bool(kind)
+
+    done_keys = _load_checkpoint(checkpoint)
+    pending = queue.Queue()
+    for chat in chats:
+        if checkpoint_key(chat) in done_keys:
+            result.skipped.append(chat)
+        else:
+            pending.put(chat)
+
+    # 图片、视频和文件仅上传一次 (已无需发送时不上传)，上传类型由前缀决定，与发送方式一致
+    if is_media and not media_id and not pending.empty():
+        path = matched.group(2)
+        if bot.media_cache is not None:
+            media_id = bot.media_cache.get_or_upload(path, kind, bot._upload_media)[0]
+        else:
+            media_id = bot._upload_media(path, kind)
+
+    total = len(chats)
+    # 发送队列已启用时，由发送队列控制频率
+    bucket = None
+    if bot.send_queue is None:
+        bucket = TokenBucket(*(limit or DEFAULT_LIMITS[MEDIA if is_media else TEXT]))
+
+    thread_lock = threading.Lock()
+    checkpoint_fp = io.open(checkpoint, 'a', encoding='utf-8') if checkpoint else None
+
+    def send_one(chat):
+        if bucket:
+            bucket.acquire()
+        ret = chat.send(content, media_id=media_id)
+        if hasattr(ret, 'result'):
+            # 发送队列返回的 Future
+            ret = ret.result()
+        return ret
+
+    def work():
+        while True:
+            try:
+                chat = pending.get_nowait()
+            except queue.Empty:
+                return
+
+            error = None
+            # noinspection PyBroadException
+            try:
+                send_one(chat)
+            except Exception as e:
+                logger.warning('failed to send to {}: {}'.format(chat, e))
+                error = e
+
+            with thread_lock:
+                if error is None:
+                    result.sent.append(chat)
+                    if checkpoint_fp:
+                        checkpoint_fp.write('{}\n'.format(checkpoint_key(chat)))
+                        checkpoint_fp.flush()
+                else:
+                    result.failed[chat] = error
+
+                if progress:
+                    # noinspection PyBroadException
+                    try:
+                        progress(len(result.sent) + len(result.failed) + len(result.skipped), total, chat, error)
+                    except:
+                        logger.exception('an error occurred in progress callback')
+
+    try:
+        threads = [start_new_thread(work) for _ in range(min(workers, pending.qsize()))]
+        for thread in threads:
+            thread.join()
+    finally:
+        if checkpoint_fp:
+            checkpoint_fp.close()
+
+    logger.info('broadcast finished: {}'.format(result))
+    return result
@@ -0,0 +1,337 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+import weakref
+
+from .misc import get_user_name
+from .search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+"""
+
+# chat index
+
+为每个机器人维护聊天对象的 identity map 和 user_name 索引
+
+* 同一个 user_name 始终对应同一个长期存在的 `Friend` / `Group` / `MP` 对象
+* 消息中的 sender / receiver / chat 等属性可在常数时间内找到对应的聊天对象
+
+
+## 数据结构
+
+ChatIndex 中包含:
+
+1. 每个 itchat 本地联系人列表 (memberList, chatroomList, mpList) 各自的 user_name -> 聊天对象
+2. 汇总后的 user_name -> 聊天对象 (公众号、好友，和有效的群聊)
+
+
+## 更新逻辑
+
+采用惰性重建的方式:
+
+* 调用 `friends(update=True)`, `groups(update=True)`, `mps(update=True)` 时，索引被标记为过期
+* 收到 itchat 的联系人变更通知 (SYSTEM 消息) 时，索引被标记为过期
+* 每次查询时，会比对 itchat 本地联系人列表的长度，若发生变化，同样视为过期
+
+重建时会复用已有的聊天对象，仅在原始数据 (raw) 发生变化时原地更新
+
+
+## 群聊分类
+
+Web 微信服务端会返回一些实际不存在的群 (shadow group)，需要排除，因此每个群会被分类为:
+
+* valid group: 包含机器人自身，直接通过
+* shadow group: 不包含机器人自身，直接抛弃
+
+分类结果保存在每个机器人各自的集合中，仅当以下情况时重新分类:
+
+* 该群的成员列表发生变化
+* 分类结果超过了 `group_check_ttl` 秒 (为 None 时不过期)
+
+已不存在于 itchat 本地联系人列表中的群，其分类结果会被一并清除
+
+
+## 用户所在的群
+
+维护 用户 user_name -> 所在群聊 user_name 集合 的反向索引，由各群的成员索引增量更新
+
+* 查找 "同时包含多个用户的群" 时，仅需对这些用户的群集合求交集
+* 每次查找前，会检查各群的成员索引是否已重建，若是则重新索引该群
+
+
+"""
+
+
+class ChatIndex(object):
+    def __init__(self, bot):
+        """
+        机器人的聊天对象索引，可通过 user_name 快速找到对应的聊天对象
+
+        :param bot: 所属的机器人
+        """
+
+        self.bot = weakref.proxy(bot)
+
+        # storage attr -> (signature, [chat, ...], {user_name: chat}, SearchIndex)
+        self._storage_chats = dict()
+
+        self._user_names = dict()
+        self._signature = None
+        self._generation = 0
+
+        # 群聊分类结果的有效秒数，为 None 时不过期
+        self.group_check_ttl = None
+
+        self.valid_groups = set()
+        self.shadow_groups = set()
+        # group user_name -> (分类时的成员数量, 分类时间)，有效的群和 shadow group 均会缓存
+        self._group_checks = dict()
+
+        # user user_name -> {group user_name, ...}
+        self._user_groups = dict()
+        # group user_name -> 建立反向索引时所用的成员索引 (user_name -> 成员)
+        self._indexed_groups = dict()
+
+        self._thread_lock = threading.RLock()
+
+    def invalidate(self, group_user_names=None):
+        """
+        将索引标记为过期，将在下一次查询时重建
+
+        :param group_user_names: 成员列表可能发生了变化的群聊 user_name 列表
+        """
+        with self._thread_lock:
+            self._generation += 1
+
+            cached = self._storage_chats.get('chatroomList')
+            if cached and group_user_names:
+                for user_name in group_user_names:
+                    group = cached[2].get(user_name)
+                    if group:
+                        # noinspection PyProtectedMember
+                        group._reset_member_index()
+
+    def _storage_signature(self, attr=None):
+        storage = self.bot.core.storageClass
+        with storage.updateLock:
+            if attr:
+                return self._generation, len(getattr(storage, attr))
+            return (
+                self._generation,
+                len(storage.memberList),
+                len(storage.chatroomList),
+                len(storage.mpList),
+            )
+
+    def storage_chats(self, attr, chat_class):
+        """
+        获取 itchat 本地联系人列表所对应的聊天对象列表 (不应修改该列表)
+
+        :param attr: itchat storage 中的列表属性名，如 'memberList'
+        :param chat_class: 聊天对象的类，如 :class:`Friend`
+        :return: 聊天对象列表
+        """
+
+        return self.storage_search_index(attr, chat_class).chats
+
+    def storage_search_index(self, attr, chat_class):
+        """
+        获取 itchat 本地联系人列表所对应的搜索索引，其 `chats` 属性即为对应的聊天对象列表
+
+        :param attr: itchat storage 中的列表属性名，如 'memberList'
+        :param chat_class: 聊天对象的类，如 :class:`Friend`
+        :return: 搜索索引
+        :rtype: :class:`wxpy.utils.SearchIndex`
+        """
+
+        with self._thread_lock:
+            signature = self._storage_signature(attr)
+            cached = self._storage_chats.get(attr)
+
+            if cached and cached[0] == signature:
+                return cached[3]
+
+            old_user_names = cached[2] if cached else dict()
+            chat_list = list()
+            user_names = dict()
+
+            for raw in self.bot._retrieve_itchat_storage(attr):
+                user_name = raw.get('UserName')
+                chat = old_user_names.get(user_name)
+                if type(chat) is not chat_class:
+                    chat = chat_class(raw, self.bot)
+                elif chat.raw is not raw:
+                    chat.raw = raw
+                chat_list.append(chat)
+                if user_name:
+                    user_names[user_name] = chat
+
+            search_index = SearchIndex(chat_list)
+            self._storage_chats[attr] = signature, chat_list, user_names, search_index
+
+            if attr == 'chatroomList':
+                self._prune_group_checks(user_names)
+
+            return search_index
+
+    def storage_chat(self, attr, chat_class, user_name):
+        """
+        在 itchat 本地联系人列表中，通过 user_name 找到对应的聊天对象
+
+        :param attr: itchat storage 中的列表属性名，如 'memberList'
+        :param chat_class: 聊天对象的类，如 :class:`Friend`
+        :param user_name: user_name
+        :return: 找到的聊天对象，或 None
+        """
+
+        return self.storage_user_names(attr, chat_class).get(user_name)
+
+    def storage_user_names(self, attr, chat_class):
+        """
+        获取 itchat 本地联系人列表所对应的 user_name -> 聊天对象 (不应修改)，
+        随聊天对象列表一并重建，可用于快速判断是否包含某个聊天对象
+
+        :param attr: itchat storage 中的列表属性名，如 'memberList'
+        :param chat_class: 聊天对象的类，如 :class:`Friend`
+        :return: user_name -> 聊天对象
+        :rtype: dict
+        """
+
+        with self._thread_lock:
+            self.storage_chats(attr, chat_class)
+            return self._storage_chats[attr][2]
+
+    def is_valid_group(self, group):
+        """
+        判断群聊是否为有效的群 (包含机器人自身)，而非服务端返回的 shadow group
+
+        :param group: 群聊对象
+        :return: 若为有效的群则为 True，否则为 False
+        """
+
+        user_name = group.user_name
+
+        # 以成员数量判断成员列表是否变化 (update_group() 和索引重建都会替换 MemberList 对象，因此不能以对象判断)
+        with self._thread_lock:
+            checked = self._group_checks.get(user_name)
+            if checked and checked[0] == len(group.raw.get('MemberList') or ()) and \
+                    (self.group_check_ttl is None or time.time() - checked[1] < self.group_check_ttl):
+                return user_name in self.valid_groups
+
+        # 成员列表可能为空，此时会更新群聊，因此需在判断后重新获取成员数量
+        valid = bool(group.bot.self in group)
+        member_count = len(group.raw.get('MemberList') or ())
+
+        with self._thread_lock:
+            if valid:
+                self.valid_groups.add(user_name)
+                self.shadow_groups.discard(user_name)
+            else:
+                self.shadow_groups.add(user_name)
+                self.valid_groups.discard(user_name)
+            self._group_checks[user_name] = member_count, time.time()
+
+        return valid
+
+    def _prune_group_checks(self, user_names):
+        for user_name in list(self._group_checks):
+            if user_name not in user_names:
+                del self._group_checks[user_name]
+                self.valid_groups.discard(user_name)
+                self.shadow_groups.discard(user_name)
+
+        for user_name in list(self._indexed_groups):
+            if user_name not in user_names:
+                self._unindex_group_members(user_name)
+
+    def _unindex_group_members(self, group_user_name):
+        member_index = self._indexed_groups.pop(group_user_name, None)
+        if member_index:
+            for user_name in member_index:
+                group_user_names = self._user_groups.get(user_name)
+                if group_user_names is not None:
+                    group_user_names.discard(group_user_name)
+                    if not group_user_names:
+                        del self._user_groups[user_name]
+
+    def _index_group_members(self, group):
+        # noinspection PyProtectedMember
+        member_index = group._member_index()[1]
+        group_user_name = group.user_name
+
+        with self._thread_lock:
+            if self._indexed_groups.get(group_user_name) is member_index:
+                return
+
+            self._unindex_group_members(group_user_name)
+            for user_name in member_index:
+                self._user_groups.setdefault(user_name, set()).add(group_user_name)
+            self._indexed_groups[group_user_name] = member_index
+
+    def groups_with_users(self, groups, users):
+        """
+        在给定的群聊中，找到同时包含所有指定用户的群聊
+
+        :param groups: 群聊列表 (仅处理属于当前机器人的群聊)
+        :param users: 用户列表或 user_name 列表
+        :return: 匹配的群聊 user_name 集合
+        :rtype: set
+        """
+
+        group_user_names = set()
+        for group in groups:
+            if group.bot.chat_index is self:
+                self._index_group_members(group)
+                group_user_names.add(group.user_name)
+
+        with self._thread_lock:
+            for user_name in get_user_name(list(users)):
+                group_user_names &= self._user_groups.get(user_name, set())
+                if not group_user_names:
+                    break
+
+        return group_user_names
+
+    def _rebuild(self):
+        user_names = dict()
+
+        # 与原先的查找顺序保持一致: 好友优先于公众号
+        for chats in self.bot.mps(), self.bot.friends(), self.bot.groups():
+            for chat in chats:
+                user_names[chat.user_name] = chat
+
+        self._user_names = user_names
+        logger.debug('{}: chat index rebuilt ({} chats)'.format(self.bot, len(user_names)))
+
+    def _ensure_fresh(self):
+        with self._thread_lock:
+            signature = self._storage_signature()
+            if signature != self._signature:
+                self._rebuild()
+                self._signature = signature
+
+    def get(self, user_name, default=None):
+        """
+        通过 user_name 找到对应的聊天对象
+
+        :param user_name: user_name
+        :param default: 找不到时返回的默认值
+        :return: 找到的聊天对象，或 default
+        """
+
+        if not user_name:
+            return default
+
+        self._ensure_fresh()
+        return self._user_names.get(user_name, default)
+
+    def __contains__(self, user_name):
+        return self.get(user_name) is not None
+
+    def __len__(self):
+        self._ensure_fresh()
+        return len(self._user_names)
@@ -0,0 +1,101 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from wxpy.compatible import PY2
+
+
+class InvalidatingList(list):
+    """
+    | 带有缓存的列表基类: 以下修改列表内容的方法，在执行后 (包括抛出异常时) 都会调用 `_invalidate()`
+    | append, extend, insert, remove, pop, clear, sort, reverse, 以及 `[]=`, `del []`, `+=`, `*=`
+    | 子类通过重写 `_invalidate()` 清除与列表内容对应的缓存
+    """
+
+    def _invalidate(self):
+        pass
+
+    def append(self, item):
+        try:
+            return super(InvalidatingList, self).append(item)
+        finally:
+            self._invalidate()
+
+    def extend(self, items):
+        try:
+            return super(InvalidatingList, self).extend(items)
+        finally:
+            self._invalidate()
+
+    def insert(self, index, item):
+        try:
+            return super(InvalidatingList, self).insert(index, item)
+        finally:
+            self._invalidate()
+
+    def remove(self, item):
+        try:
+            return super(InvalidatingList, self).remove(item)
+        finally:
+            self._invalidate()
+
+    def pop(self, *args):
+        try:
+            return super(InvalidatingList, self).pop(*args)
+        finally:
+            self._invalidate()
+
+    def clear(self):
+        try:
+            # Python 2 的 list 没有 clear()
+            del self[:]
+        finally:
+            self._invalidate()
+
+    def sort(self, *args, **kwargs):
+        try:
+            return super(InvalidatingList, self).sort(*args, **kwargs)
+        finally:
+            self._invalidate()
+
+    def reverse(self):
+        try:
+            return super(InvalidatingList, self).reverse()
+        finally:
+            self._invalidate()
+
+    def __setitem__(self, key, value):
+        try:
+            return super(InvalidatingList, self).__setitem__(key, value)
+        finally:
+            self._invalidate()
+
+    def __delitem__(self, key):
+        try:
+            return super(InvalidatingList, self).__delitem__(key)
+        finally:
+            self._invalidate()
+
+    def __iadd__(self, other):
+        try:
+            return super(InvalidatingList, self).__iadd__(other)
+        finally:
+            self._invalidate()
+
+    def __imul__(self, n):
+        try:
+            return super(InvalidatingList, self).__imul__(n)
+        finally:
+            self._invalidate()
+
+    if PY2:
+        def __setslice__(self, i, j, sequence):
+            try:
+                return super(InvalidatingList, self).__setslice__(i, j, sequence)
+            finally:
+                self._invalidate()
+
+        def __delslice__(self, i, j):
+            try:
+                return super(InvalidatingList, self).__delslice__(i, j)
+            finally:
+                self._invalidate()
@@ -0,0 +1,249 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from wxpy.exceptions import ResponseError
+from .send_queue import FREQ_LIMIT_CODES
+
+logger = logging.getLogger(__name__)
+
+"""
+
+# media cache
+
+按文件内容缓存上传后获得的 media_id，重复发送相同的图片、视频或文件时不再重新上传
+
+* 缓存的键为 (内容的 SHA-1, 文件大小, 上传类型)，因此不同路径的相同文件可共用同一个 media_id
+* 计算 SHA-1 时分块读取文件，不会将整个文件载入内存
+* 以 (路径, 修改时间, 文件大小) 记住最近计算过的 SHA-1，文件未变化时无需重新读取
+* media_id 在上传后的 ttl 秒内有效，过期后重新上传
+* 使用缓存的 media_id 发送失败，且错误可能因 media_id 失效引起时，将移出该缓存并重新上传 (见 `wrapped_send`)
+* 上传类型统一由 `upload_kind()` 决定，使不同的发送方式对同一文件得到相同的缓存键
+
+
+"""
+
+# 分块读取文件的大小
+_CHUNK_SIZE = 1024 * 1024
+
+# 按扩展名判断上传类型时，图片和视频的扩展名 (其余均作为文件上传)
+_EXT_KINDS = {'.bmp': 'pic', '.png': 'pic', '.jpeg': 'pic', '.jpg': 'pic', '.gif': 'pic', '.mp4': 'video'}
+
+# 与文件本身无关的错误码: 非好友关系 (1204)、已掉线 (1100 - 1102)，以及频率限制
+_NON_MEDIA_CODES = (1204, 1100, 1101, 1102) + FREQ_LIMIT_CODES
+
+
+def upload_kind(path, send_type=None):
+    """
+    获取文件的上传类型
+
+    与 itchat 的 `send_image()` 一致，GIF 图片以文件方式上传
+
+    :param path: 文件路径
+    :param send_type:
+        发送方式，可为消息类型 (PICTURE, VIDEO, ATTACHMENT)，或 itchat `send()` 中的前缀 ('img', 'vid', 'fil')，
+        为 None 时按扩展名判断
+    :return: 'pic', 'video' 或 'doc'，若该发送方式无需上传文件，则为 None
+    """
+
+    from wxpy.api.consts import ATTACHMENT, PICTURE, VIDEO
+
+    ext = os.path.splitext(path)[1].lower()
+
+    if send_type is None:
+        kind = _EXT_KINDS.get(ext, 'doc')
+    elif send_type in (PICTURE, 'img'):
+        kind = 'pic'
+    elif send_type in (VIDEO, 'vid'):
+        kind = 'video'
+    elif send_type in (ATTACHMENT, 'fil'):
+        kind = 'doc'
+    else:
+        return
+
+    if kind == 'pic' and ext == '.gif':
+        kind = 'doc'
+    return kind
+
+
+def is_invalid_media_error(error):
+    """
+    判断使用缓存的 media_id 发送时遇到的错误，是否可能因 media_id 已失效引起 (需要重新上传)
+
+    Web 微信未公开 media_id 失效时的错误码，因此排除已知与文件无关的错误，以及本地错误 (负数错误码)
+
+    :param error: 发送时的异常
+    """
+
+    if not isinstance(error, ResponseError):
+        return False
+    try:
+        err_code = int(error.err_code)
+    except (TypeError, ValueError):
+        return False
+    return err_code > 0 and err_code not in _NON_MEDIA_CODES
+
+
+def file_digest(path):
+    """
+    分块读取文件，计算其内容的 SHA-1
+
+    :param path: 文件路径
+    :return: 十六进制的 SHA-1
+    """
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        while True:
+            chunk = fp.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class MediaCache(object):
+    def __init__(self, ttl=3 * 60 * 60, max_entries=1000):
+        """
+        按文件内容缓存 media_id，默认已为每个机器人启用 (`bot.media_cache`)，设为 None 可关闭
+
+        :param ttl: media_id 的有效秒数
+        :param max_entries: 最多缓存的 media_id 数量 (以及记住的文件 SHA-1 数量)
+        """
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # (SHA-1, 大小, 上传类型) -> (media_id, 上传时间)
+        self._entries = OrderedDict()
+        # 文件的绝对路径 -> (修改时间, 大小, SHA-1)
+        self._digests = OrderedDict()
+        # 键 -> 上传锁，避免同时上传相同的文件
+        self._upload_locks = dict()
+        self._thread_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<{}: {} media>'.format(self.__class__.__name__, len(self))
+
+    def key(self, path, kind):
+        """
+        获取文件的缓存键
+
+        :param path: 文件路径
+        :param kind: 上传类型 ('pic', 'video' 或 'doc')
+        :return: (SHA-1, 大小, 上传类型)
+        """
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        with self._thread_lock:
+            known = self._digests.get(path)
+        if known and known[:2] == (stat.st_mtime, stat.st_size):
+            digest = known[2]
+        else:
+            digest = file_digest(path)
+            with self._thread_lock:
+                self._digests.pop(path, None)
+                self._digests[path] = stat.st_mtime, stat.st_size, digest
+                while len(self._digests) > self.max_entries:
+                    self._digests.popitem(last=False)
+
+        return digest, stat.st_size, kind
+
+    def get(self, key):
+        """
+        获取仍然有效的 media_id
+
+        :param key: 缓存键
+        :return: media_id，若没有或已过期，则为 None
+        """
+
+        with self._thread_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if time.time() - entry[1] < self.ttl:
+                return entry[0]
+            del self._entries[key]
+
+    def set(self, key, media_id):
+        """
+        保存上传后获得的 media_id
+
+        :param key: 缓存键
+        :param media_id: media_id
+        """
+
+        with self._thread_lock:
+            self._entries.pop(key, None)
+            self._entries[key] = media_id, time.time()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_upload(self, path, kind, upload):
+        """
+        获取文件的 media_id，若没有缓存，则上传并保存
+
+        :param path: 文件路径
+        :param kind: 上传类型 ('pic', 'video' 或 'doc')
+        :param upload: 上传函数，接收参数 path, kind，返回 media_id
+        :return: (media_id, 是否来自缓存)
+        """
+
+        try:
+            key = self.key(path, kind)
+        except (OSError, IOError):
+            # 文件不存在或无法读取时不使用缓存，由上传函数给出与 itchat 一致的错误 (ResponseError -1002)
+            return upload(path, kind), False
+
+        with self._thread_lock:
+            upload_lock = self._upload_locks.setdefault(key, threading.Lock())
+
+        try:
+            with upload_lock:
+                media_id = self.get(key)
+                if media_id:
+                    logger.debug('using cached media_id for {}'.format(path))
+                    return media_id, True
+
+                media_id = upload(path, kind)
+                if media_id:
+                    self.set(key, media_id)
+                return media_id, False
+        finally:
+            with self._thread_lock:
+                self._upload_locks.pop(key, None)
+
+    def invalidate(self, path, kind):
+        """
+        移出文件的 media_id (例如已失效时)
+
+        :param path: 文件路径
+        :param kind: 上传类型
+        """
+
+        try:
+            key = self.key(path, kind)
+        except (OSError, IOError):
+            return
+        with self._thread_lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+
+        with self._thread_lock:
+            self._entries.clear()
+            self._digests.clear()
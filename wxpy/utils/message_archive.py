@@ -0,0 +1,370 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import atexit
+import datetime
+import logging
+import sqlite3
+import time
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+from wxpy.compatible.utils import force_encoded_string_output
+from .message_index import keyword_terms, text_terms, to_timestamp
+from .misc import match_text, prepare_keywords, start_new_thread
+
+logger = logging.getLogger(__name__)
+
+"""
+
+# message archive
+
+将历史消息存档到本地的 SQLite 数据库中，不受 `Messages.max_history` 的限制，可用于长期的消息审计
+
+
+## 写入
+
+* `Messages.append()` 仅将消息放入队列，不会阻塞消息处理
+* 后台线程从队列中批量取出消息 (最多 `batch_size` 条，或等待 `flush_interval` 秒)，在单个事务中写入
+* 写入时才会解析消息的聊天对象、名称和 puid (若已启用)
+
+
+## 全文检索
+
+使用 SQLite 的 FTS5 (若不可用则为 FTS4) 虚拟表，其中不保存原文，仅保存索引词 (与 MessageTextIndex 一致):
+
+* 拉丁字母和数字组成的词
+* 中日韩文字的单字和相邻双字
+
+查询时，关键词中的字母数字作为前缀匹配，中日韩文字的双字须全部出现，再使用 `match_text()` 确认
+因此中文关键词的结果与子串匹配一致，而字母数字仅匹配词的开头 (例如 "wxp" 可以匹配 "wxpy"，但 "xpy" 不能)
+
+
+## 读取
+
+查询结果为生成器，逐条从数据库中读取，不会一次性载入内存
+
+
+"""
+
+# 队列中的控制标记: 停止写入线程 / 立即写入当前批次
+_STOP = object()
+_FLUSH = object()
+
+_COLUMNS = (
+    'id', 'type', 'text', 'url', 'file_name', 'create_time', 'receive_time', 'is_sent',
+    'chat_user_name', 'chat_name', 'chat_puid',
+    'sender_user_name', 'sender_name', 'sender_puid',
+    'member_user_name', 'member_name', 'member_puid',
+)
+
+
+class ArchivedMessage(object):
+    """
+    从消息存档中读取的消息记录
+
+    | 聊天对象仅以 user_name, 名称和 puid (需启用) 的形式保存，例如 `chat_name`, `sender_puid`
+    | 注意 user_name 在每次登陆后都会变化，长期保存的记录建议使用 puid 或名称来区分聊天对象
+    """
+
+    __slots__ = _COLUMNS
+
+    def __init__(self, row):
+        for name, value in zip(_COLUMNS, row):
+            setattr(self, name, value)
+
+        for name in 'create_time', 'receive_time':
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, datetime.datetime.fromtimestamp(value))
+
+        self.is_sent = bool(self.is_sent)
+
+    def __hash__(self):
+        return hash((ArchivedMessage, self.id))
+
+    @force_encoded_string_output
+    def __repr__(self):
+        return self.__unicode__()
+
+    def __unicode__(self):
+        if self.member_name and self.member_user_name != self.chat_user_name:
+            sender = '{} › {}'.format(self.chat_name, self.member_name)
+        else:
+            sender = self.sender_name
+        text = (self.text or '').replace('\n', ' ↩ ')
+        return '<{}: {} : {}{}({})>'.format(
+            self.__class__.__name__, sender, text, ' ' if text else '', self.type)
+
+
+def _describe_chat(chat):
+    if chat is None:
+        return None, None, None
+
+    puid = None
+    if chat.bot.puid_map:
+        puid = chat.bot.puid_map.get_puid(chat)
+
+    return chat.user_name, chat.name, puid
+
+
+def _message_row(msg):
+    from wxpy.api.messages import SentMessage
+
+    text = msg.text
+    if text is not None and not isinstance(text, str):
+        text = '{}'.format(text)
+
+    return (
+        msg.id, msg.type, text, getattr(msg, 'url', None), getattr(msg, 'file_name', None),
+        to_timestamp(msg.create_time), to_timestamp(msg.receive_time), isinstance(msg, SentMessage),
+    ) + _describe_chat(msg.chat) + _describe_chat(msg.sender) + _describe_chat(msg.member)
+
+
+def _keyword_query(keywords):
+    """
+    将关键词转为 FTS 查询语句，若关键词中没有可用于索引的部分，则为 None
+    """
+
+    terms = list()
+    for kw in prepare_keywords(keywords):
+        tokens, grams = keyword_terms(kw)
+        terms.extend('{}*'.format(token) for token in tokens)
+        terms.extend(sorted(grams))
+
+    if terms:
+        return ' '.join(terms)
+
+
+class MessageArchive(object):
+    def __init__(self, path, batch_size=500, flush_interval=1):
+        """
+        基于 SQLite 全文检索的消息存档，可通过 :meth:`Bot.enable_archive` 启用
+
+        :param path: 数据库文件的路径
+        :param batch_size: 每次批量写入的最大消息数量
+        :param flush_interval: 批量写入前等待更多消息的最长秒数
+        """
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue()
+        self._fts = None
+        self._closed = False
+
+        conn = self._connect()
+        try:
+            with conn:
+                self._create_tables(conn)
+        finally:
+            conn.close()
+
+        self._writer = start_new_thread(self._write_loop)
+
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _create_tables(self, conn):
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS messages (rowid INTEGER PRIMARY KEY, {})'.format(', '.join(_COLUMNS)))
+        conn.execute('CREATE INDEX IF NOT EXISTS messages_create_time ON messages (create_time)')
+        conn.execute('CREATE INDEX IF NOT EXISTS messages_chat_user_name ON messages (chat_user_name)')
+        conn.execute('CREATE INDEX IF NOT EXISTS messages_chat_puid ON messages (chat_puid)')
+        conn.execute('CREATE INDEX IF NOT EXISTS messages_chat_name ON messages (chat_name)')
+
+        # 优先使用 FTS5，不保存原文 (contentless)
+        for fts, options in ('fts5', "terms, content=''"), ('fts4', 'terms, content=""'):
+            try:
+                conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING {}({})'.format(fts, options))
+            except sqlite3.OperationalError:
+                continue
+            else:
+                self._fts = fts
+                break
+        else:
+            raise RuntimeError('SQLite full-text search (FTS5 or FTS4) is not available')
+
+    def append(self, msg):
+        """
+        将消息放入写入队列 (由 `Messages.append()` 调用，不会阻塞)
+
+        :param msg: :class:`Message` 或 :class:`SentMessage`
+        """
+        if not self._closed:
+            self._queue.put(msg)
+
+    def flush(self):
+        """
+        堵塞直到队列中的消息全部写入
+        """
+        if not self._closed:
+            self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """
+        写入剩余的消息，并停止后台写入线程 (程序退出时会自动调用)
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.time() + self.flush_interval
+
+        while batch[-1] is not _STOP and batch[-1] is not _FLUSH and len(batch) < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = self._next_batch()
+                try:
+                    self._write(conn, [msg for msg in batch if msg is not _STOP and msg is not _FLUSH])
+                except Exception:
+                    logger.exception('failed to archive {} messages'.format(len(batch)))
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+
+                if batch[-1] is _STOP:
+                    break
+        finally:
+            conn.close()
+
+    def _write(self, conn, msgs):
+        rows = list()
+        for msg in msgs:
+            # noinspection PyBroadException
+            try:
+                rows.append(_message_row(msg))
+            except Exception:
+                logger.exception('failed to archive msg: {}'.format(msg))
+
+        if not rows:
+            return
+
+        with conn:
+            for row in rows:
+                cursor = conn.execute(
+                    'INSERT INTO messages ({}) VALUES ({})'.format(
+                        ', '.join(_COLUMNS), ', '.join('?' * len(_COLUMNS))), row)
+                tokens, grams = text_terms((row[2] or '').lower())
+                conn.execute(
+                    'INSERT INTO messages_fts (rowid, terms) VALUES (?, ?)',
+                    (cursor.lastrowid, ' '.join(sorted(tokens | grams))))
+
+        logger.debug('archived {} messages'.format(len(rows)))
+
+    def __len__(self):
+        self.flush()
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        finally:
+            conn.close()
+
+    def __iter__(self):
+        return self.search()
+
+    def search(self, keywords=None, chat=None, sender=None, member=None, msg_type=None,
+               since=None, until=None, limit=None, newest_first=False):
+        """
+        搜索存档中的消息，结果将逐条从数据库中读取
+
+        ::
+
+            # 某个群在 3 月份中所有包含 "合同" 的消息
+            for msg in archive.search('合同', chat='公司微信群', since=datetime(2017, 3, 1), until=datetime(2017, 4, 1)):
+                print(msg)
+
+        :param keywords: 文本关键词 (字母数字仅匹配词的开头)
+        :param chat: 聊天会话，可以是聊天对象 (启用 puid 时按 puid 匹配，否则按 user_name 匹配)，
+            或是 user_name / puid / 名称 字符串
+        :param sender: 发送者，格式同 chat
+        :param member: 群聊消息的实际发送人，格式同 chat
+        :param msg_type: 消息类型，如 TEXT
+        :param since: 起始的消息创建时间 (datetime，含)
+        :param until: 结束的消息创建时间 (datetime，不含)
+        :param limit: 最多返回的消息数量
+        :param newest_first: 为 True 时从最新的消息开始返回，否则按存档顺序返回
+        :return: :class:`ArchivedMessage` 的生成器
+        """
+
+        self.flush()
+
+        conditions, params = list(), list()
+
+        fts_query = _keyword_query(keywords)
+        if fts_query:
+            conditions.append('rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)')
+            params.append(fts_query)
+
+        for prefix, value in ('chat', chat), ('sender', sender), ('member', member):
+            if value is None:
+                continue
+            from wxpy.api.chats import Chat
+            if isinstance(value, Chat):
+                if value.bot.puid_map:
+                    conditions.append('{}_puid = ?'.format(prefix))
+                    params.append(value.puid)
+                else:
+                    conditions.append('{}_user_name = ?'.format(prefix))
+                    params.append(value.user_name)
+            else:
+                conditions.append('? IN ({0}_user_name, {0}_puid, {0}_name)'.format(prefix))
+                params.append(value)
+
+        if msg_type is not None:
+            conditions.append('type = ?')
+            params.append(msg_type)
+        if since is not None:
+            conditions.append('create_time >= ?')
+            params.append(to_timestamp(since))
+        if until is not None:
+            conditions.append('create_time < ?')
+            params.append(to_timestamp(until))
+
+        sql = 'SELECT {} FROM messages'.format(', '.join(_COLUMNS))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY rowid {}'.format('DESC' if newest_first else 'ASC')
+
+        return self._iter_results(sql, params, keywords, limit)
+
+    def _iter_results(self, sql, params, keywords, limit):
+        conn = self._connect()
+        try:
+            count = 0
+            for row in conn.execute(sql, params):
+                if limit is not None and count >= limit:
+                    break
+                # 通过子串匹配确认 (FTS 中的中日韩双字不保证相邻顺序)
+                if not match_text(row[2], keywords):
+                    continue
+                count += 1
+                yield ArchivedMessage(row)
+        finally:
+            conn.close()
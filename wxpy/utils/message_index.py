@@ -0,0 +1,379 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import bisect
+import datetime
+import re
+import time
+from collections import deque
+
+from .misc import prepare_keywords
+from .search_index import keyword_ngrams, text_ngrams
+
+"""
+
+# message index
+
+为历史消息建立二级索引，用于加速 `Messages.query()`，以及可选的文本倒排索引，用于加速 `Messages.search()`
+
+* 无需解析聊天对象: 所有键均直接取自消息的原始数据 (user_name 等)
+* 随 `Messages.append()` 增量更新，最旧的消息被移出历史时，同步移出索引
+
+
+## 数据结构
+
+每条消息对应一个条目 (序号, 消息, 键)，其中序号按加入顺序递增
+
+1. 按加入顺序排列的所有条目
+2. chat / sender / member / type 四种键各自的 键 -> 按加入顺序排列的条目
+3. 按创建时间排序的 (时间戳, 序号, 条目) 列表，可通过 bisect 找到时间范围
+
+
+## 移出逻辑
+
+历史消息总是按加入顺序被移出，因此:
+
+* 对于按加入顺序排列的条目，仅需从左侧移出
+* 对于时间列表，采用延迟删除: 序号小于最旧的有效条目时视为已移出，
+  当已移出的条目多于有效条目时，再一并清理 (均摊常数时间)
+
+
+## 文本倒排索引
+
+对消息文本 (小写) 中的以下索引词，建立 索引词 -> 按加入顺序排列的序号 的倒排索引
+
+* 拉丁字母和数字组成的词 (例如 "hello", "2017")
+* 中日韩文字的单字和相邻双字
+
+查询时，关键词中每段连续的字母数字须为某个索引词的子串 (遍历词表)，每段中日韩文字的双字须全部出现，
+以此得到候选消息，再使用 `match_text()` 确认，因此结果与逐条进行子串匹配完全一致
+
+索引词同样按加入顺序排列，因此移出最旧的消息时，仅需从各倒排列表的左侧移出
+
+
+"""
+
+KEY_NAMES = 'chat', 'sender', 'member', 'type'
+
+# 拉丁字母和数字组成的词
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+# 中日韩文字
+_CJK_RE = re.compile('[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+
+
+def to_timestamp(dt):
+    """
+    将 datetime 转为本地时间戳 (兼容 Python 2)
+
+    :param dt: datetime 或时间戳
+    :return: 时间戳，若无法转换则为 None
+    """
+
+    if isinstance(dt, datetime.datetime):
+        return time.mktime(dt.timetuple()) + dt.microsecond / 1e6
+    elif isinstance(dt, (int, float)):
+        return dt
+
+
+def message_keys(msg):
+    """
+    获取消息在各索引中的键，均直接取自原始数据，与 Message / SentMessage 的同名属性一致
+
+    :param msg: :class:`Message` 或 :class:`SentMessage`
+    :return: (chat, sender, member, type, 创建时间戳)，其中 chat, sender, member 为 user_name
+    """
+
+    raw = getattr(msg, 'raw', None)
+
+    if isinstance(raw, dict):
+        # Message
+        from_user_name = raw.get('FromUserName')
+        if from_user_name == msg.bot.self.user_name:
+            chat = raw.get('ToUserName')
+        else:
+            chat = from_user_name
+        # itchat 仅为群聊消息设置 ActualUserName (包括自己在群聊中发出的消息)
+        return chat, from_user_name, raw.get('ActualUserName'), raw.get('Type'), raw.get('CreateTime')
+
+    receiver = getattr(msg, 'receiver', None)
+    if receiver is not None:
+        # SentMessage
+        from wxpy.api.chats import Group
+        self_user_name = receiver.bot.self.user_name
+        return (
+            receiver.user_name, self_user_name,
+            self_user_name if isinstance(receiver, Group) else None,
+            msg.type, to_timestamp(msg.create_time)
+        )
+
+    return None, None, None, getattr(msg, 'type', None), None
+
+
+class MessageIndex(object):
+    def __init__(self, msgs=()):
+        """
+        历史消息的二级索引
+
+        :param msgs: 初始的消息 (按加入顺序)
+        """
+
+        # 按加入顺序排列的条目: (序号, 消息, 键)
+        self._entries = deque()
+        # 键的名称 -> 键 -> 按加入顺序排列的条目
+        self._keys = dict((name, dict()) for name in KEY_NAMES)
+        # 按创建时间排序的 (时间戳, 序号, 条目)，包含已移出的条目
+        self._times = list()
+
+        self._next_seq = 0
+
+        for msg in msgs:
+            self.add(msg)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, msg):
+        """
+        加入一条最新的消息
+
+        :param msg: 消息
+        """
+
+        keys = message_keys(msg)
+        entry = self._next_seq, msg, keys
+        self._next_seq += 1
+
+        self._entries.append(entry)
+
+        for name, key in zip(KEY_NAMES, keys):
+            if key is not None:
+                index = self._keys[name]
+                entries = index.get(key)
+                if entries is None:
+                    entries = index[key] = deque()
+                entries.append(entry)
+
+        timestamp = keys[4]
+        if timestamp is not None:
+            item = timestamp, entry[0], entry
+            if not self._times or self._times[-1] < item:
+                self._times.append(item)
+            else:
+                bisect.insort(self._times, item)
+
+    def remove_oldest(self):
+        """
+        移出最旧的消息
+        """
+
+        entry = self._entries.popleft()
+
+        for name, key in zip(KEY_NAMES, entry[2]):
+            if key is not None:
+                index = self._keys[name]
+                entries = index[key]
+                entries.popleft()
+                if not entries:
+                    del index[key]
+
+        if len(self._times) > 2 * len(self._entries) + 16:
+            oldest_seq = self._oldest_seq()
+            self._times = [item for item in self._times if item[1] >= oldest_seq]
+
+    def _oldest_seq(self):
+        return self._entries[0][0] if self._entries else self._next_seq
+
+    def query(self, chat=None, sender=None, member=None, msg_type=None, since=None, until=None, limit=None):
+        """
+        通过索引查询消息，参数均为 None 时表示不作限制
+
+        :param chat: 聊天会话的 user_name
+        :param sender: 发送者的 user_name
+        :param member: 群成员的 user_name
+        :param msg_type: 消息类型
+        :param since: 起始时间戳 (含)
+        :param until: 结束时间戳 (不含)
+        :param limit: 仅返回最后 n 条
+        :return: 匹配的消息列表 (按加入顺序)
+        """
+
+        conditions = [(i, key) for i, key in enumerate((chat, sender, member, msg_type)) if key is not None]
+        timed = since is not None or until is not None
+
+        # 选择最小的候选集合: 某个键的条目，时间范围内的条目，或所有条目
+        candidates = self._entries
+        for i, key in conditions:
+            entries = self._keys[KEY_NAMES[i]].get(key)
+            if not entries:
+                return list()
+            if len(entries) < len(candidates):
+                candidates = entries
+
+        if timed:
+            lo = 0 if since is None else bisect.bisect_left(self._times, (since,))
+            hi = len(self._times) if until is None else bisect.bisect_left(self._times, (until,))
+            if hi - lo < len(candidates):
+                oldest_seq = self._oldest_seq()
+                candidates = sorted(
+                    (item[2] for item in self._times[lo:hi] if item[1] >= oldest_seq),
+                    key=lambda x: x[0]
+                )
+
+        def match(entry):
+            keys = entry[2]
+            for _i, _key in conditions:
+                if keys[_i] != _key:
+                    return False
+            if timed:
+                timestamp = keys[4]
+                if timestamp is None:
+                    return False
+                if since is not None and timestamp < since:
+                    return False
+                if until is not None and timestamp >= until:
+                    return False
+            return True
+
+        found = list()
+        for entry in reversed(candidates):
+            if limit is not None and len(found) >= limit:
+                break
+            if match(entry):
+                found.append(entry[1])
+
+        found.reverse()
+        return found
+
+
+def text_terms(text):
+    """
+    获取文本中的索引词: 拉丁字母和数字组成的词，以及中日韩文字的单字和相邻双字
+
+    :param text: 文本 (应已转为小写)
+    :return: (词的集合, 单字和双字的集合)
+    """
+
+    tokens = set(_TOKEN_RE.findall(text))
+    grams = set()
+    for run in _CJK_RE.findall(text):
+        grams |= text_ngrams(run)
+    return tokens, grams
+
+
+def keyword_terms(keyword):
+    """
+    获取关键词中用于查找索引的部分: 每段连续的字母数字，以及每段中日韩文字的双字 (不足双字时为单字)
+
+    :param keyword: 单个关键词 (应已经过 `prepare_keywords()` 处理)
+    :return: (字母数字段的列表, 单字和双字的集合)
+    """
+
+    tokens = _TOKEN_RE.findall(keyword)
+    grams = set()
+    for run in _CJK_RE.findall(keyword):
+        grams |= keyword_ngrams(run)
+    return tokens, grams
+
+
+class MessageTextIndex(object):
+    def __init__(self, msgs=()):
+        """
+        历史消息文本的倒排索引，用于加速 `Messages.search()` 中的关键词匹配
+
+        | 关键词作为子串出现时，其中每段连续的字母数字必为某个词的子串，每段中日韩文字的双字也必然出现
+        | 因此可通过倒排索引找到候选消息，再使用 `match_text()` 逐一确认，结果与逐条匹配完全一致
+
+        :param msgs: 初始的消息 (按加入顺序)
+        """
+
+        # 按加入顺序排列的 (序号, 索引词)
+        self._entries = deque()
+        # 序号 -> 消息
+        self._messages = dict()
+        # 词 / 单字和双字 -> 按加入顺序排列的序号
+        self._tokens = dict()
+        self._grams = dict()
+
+        self._next_seq = 0
+
+        for msg in msgs:
+            self.add(msg)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, msg):
+        """
+        加入一条最新的消息
+
+        :param msg: 消息
+        """
+
+        seq = self._next_seq
+        self._next_seq += 1
+
+        text = msg.text
+        tokens, grams = text_terms(text.lower() if text else '')
+
+        self._entries.append((seq, tuple(tokens), tuple(grams)))
+        self._messages[seq] = msg
+
+        for postings, terms in (self._tokens, tokens), (self._grams, grams):
+            for term in terms:
+                seqs = postings.get(term)
+                if seqs is None:
+                    seqs = postings[term] = deque()
+                seqs.append(seq)
+
+    def remove_oldest(self):
+        """
+        移出最旧的消息
+        """
+
+        seq, tokens, grams = self._entries.popleft()
+        del self._messages[seq]
+
+        for postings, terms in (self._tokens, tokens), (self._grams, grams):
+            for term in terms:
+                seqs = postings[term]
+                seqs.popleft()
+                if not seqs:
+                    del postings[term]
+
+    def candidates(self, keywords):
+        """
+        通过倒排索引找到可能匹配的消息 (仍需使用 `match_text()` 确认)
+
+        :param keywords: 文本关键词，与 `match_text()` 相同
+        :return: 候选消息的列表 (按加入顺序)
+        """
+
+        positions = None
+
+        for kw in prepare_keywords(keywords):
+            tokens, grams = keyword_terms(kw)
+
+            for token in tokens:
+                # 关键词中的每段字母数字，必为消息中某个词的子串
+                found = set()
+                for term, seqs in self._tokens.items():
+                    if token in term:
+                        found.update(seqs)
+                positions = found if positions is None else positions & found
+
+            # 每段中日韩文字的双字 (或单字) 须全部出现，从最短的倒排列表开始求交集
+            for gram in sorted(grams, key=lambda x: len(self._grams.get(x, ()))):
+                if positions is not None and not positions:
+                    break
+                found = self._grams.get(gram, ())
+                positions = set(found) if positions is None else positions.intersection(found)
+
+            if positions is not None and not positions:
+                break
+
+        if positions is None:
+            seqs = (entry[0] for entry in self._entries)
+        else:
+            seqs = sorted(positions)
+
+        return [self._messages[seq] for seq in seqs]
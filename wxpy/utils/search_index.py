@@ -0,0 +1,244 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import threading
+from collections import Counter
+
+from .misc import prepare_keywords
+
+"""
+
+# search index
+
+为固定的聊天对象列表建立名称索引，用于加速 `Chats.search()` 中的关键词匹配
+
+
+## 数据结构
+
+对每个聊天对象的 remark_name, display_name, nick_name, wxid (与 `match_name()` 一致)，
+取其小写文本的所有单字和相邻双字 (n-gram)，建立 n-gram -> 聊天对象序号集合 的倒排索引
+
+
+## 查询逻辑
+
+* 关键词的所有 n-gram 都出现在某个聊天对象中，是该关键词作为子串出现的必要条件
+* 因此可先通过倒排索引的交集快速找到候选对象，再使用 `match_name()` 逐一确认
+* 最终结果与逐个匹配完全一致
+
+之所以对中文和英文均使用 n-gram，而非对英文分词，
+是因为分词无法覆盖 "ouf" in "youfou" 这样的子串匹配
+
+
+## 属性索引
+
+对 `SearchIndex.indexed_attributes` 中的每个属性 (可按需增减)，在首次使用时建立 属性值 -> 聊天对象序号集合 的哈希索引
+
+* `search(province='广东', sex=MALE)` 通过各属性的倒排列表求交集，得到候选对象
+* `stats()` 直接从索引中读取各属性值的数量
+* 未建立索引的属性，或属性值不可哈希时，回退为逐个匹配
+
+
+"""
+
+
+def text_ngrams(text, n=2):
+    """
+    获取文本中所有长度为 1 至 n 的连续子串
+
+    :param text: 文本
+    :param n: 最大长度
+    :return: 子串集合
+    :rtype: set
+    """
+
+    grams = set()
+    for size in range(1, n + 1):
+        for i in range(len(text) - size + 1):
+            grams.add(text[i:i + size])
+    return grams
+
+
+def keyword_ngrams(keyword, n=2):
+    """
+    获取查询关键词所需的 n-gram: 长度不足 n 时为关键词本身，否则为所有长度为 n 的连续子串
+
+    :param keyword: 关键词
+    :param n: n-gram 的长度
+    :return: n-gram 集合 (空关键词为空集合)
+    :rtype: set
+    """
+
+    if len(keyword) <= n:
+        return {keyword} if keyword else set()
+    return {keyword[i:i + n] for i in range(len(keyword) - n + 1)}
+
+
+def intersect_postings(postings, grams):
+    """
+    求多个 n-gram 的倒排列表的交集
+
+    :param postings: n-gram -> 序号集合
+    :param grams: 需要同时满足的 n-gram
+    :return: 序号集合，若 grams 为空则为 None (表示不作限制)
+    """
+
+    if not grams:
+        return None
+
+    sets = sorted((postings.get(gram, frozenset()) for gram in grams), key=len)
+    ret = set(sets[0])
+    for s in sets[1:]:
+        if not ret:
+            break
+        ret &= s
+    return ret
+
+
+class AttributeIndex(object):
+    def __init__(self, chats, attr):
+        """
+        单个属性的哈希索引
+
+        :param chats: 聊天对象列表
+        :param attr: 属性名称
+        """
+
+        self.attr = attr
+
+        # 与 match_attributes() 一致的属性值 -> 序号集合
+        self.values = dict()
+        # 与 Chats.stats() 一致的属性值 -> 数量，若有对象缺少该属性，则为 None
+        self.counts = Counter()
+
+        for i, chat in enumerate(chats):
+            try:
+                value = getattr(chat, attr)
+            except AttributeError:
+                value = None
+                self.counts = None
+            else:
+                if self.counts is not None:
+                    self.counts[value] += 1
+
+            if not value and hasattr(chat, 'raw'):
+                value = chat.raw.get(attr)
+
+            self.values.setdefault(value, set()).add(i)
+
+    def positions(self, value):
+        """
+        获取属性值等于 value 的聊天对象序号
+
+        :param value: 属性值
+        :return: 序号集合
+        """
+        return self.values.get(value, frozenset())
+
+
+class SearchIndex(object):
+    # 可使用属性索引的属性，可按需增减
+    indexed_attributes = {
+        'sex', 'province', 'city', 'signature',
+        'nick_name', 'remark_name', 'display_name',
+        'alias', 'uin', 'wxid',
+    }
+
+    def __init__(self, chats):
+        """
+        固定聊天对象列表的搜索索引 (在首次使用时才会建立)
+
+        :param chats: 聊天对象列表，建立索引后不应再修改
+        """
+
+        self.chats = chats
+
+        self._names = None
+        self._attributes = dict()
+        self._thread_lock = threading.Lock()
+
+    def _build_names(self):
+        names = dict()
+        for i, chat in enumerate(self.chats):
+            grams = set()
+            for attr in 'remark_name', 'display_name', 'nick_name', 'wxid':
+                grams |= text_ngrams('{0}'.format(getattr(chat, attr, '')).lower())
+            for gram in grams:
+                names.setdefault(gram, set()).add(i)
+        return names
+
+    def _name_positions(self, keywords):
+        with self._thread_lock:
+            if self._names is None:
+                self._names = self._build_names()
+            names = self._names
+
+        grams = set()
+        for kw in prepare_keywords(keywords):
+            grams |= keyword_ngrams(kw)
+
+        return intersect_postings(names, grams)
+
+    def attribute_index(self, attr):
+        """
+        获取指定属性的哈希索引 (在首次使用时建立)
+
+        :param attr: 属性名称
+        :return: 属性索引，若该属性不可使用索引，则为 None
+        :rtype: :class:`AttributeIndex`
+        """
+
+        if attr not in self.indexed_attributes:
+            return
+
+        with self._thread_lock:
+            if attr not in self._attributes:
+                try:
+                    self._attributes[attr] = AttributeIndex(self.chats, attr)
+                except TypeError:
+                    # 属性值不可哈希
+                    self._attributes[attr] = None
+            return self._attributes[attr]
+
+    def attribute_counts(self, attr):
+        """
+        从索引中读取各属性值的数量，与 Chats.stats() 中的统计方式一致
+
+        :param attr: 属性名称
+        :return: 各属性值的数量，若该属性不可使用索引，则为 None
+        :rtype: collections.Counter
+        """
+
+        index = self.attribute_index(attr)
+        if index and index.counts is not None:
+            return Counter(index.counts)
+
+    def candidates(self, keywords=None, **attributes):
+        """
+        通过名称和属性索引找到可能匹配的聊天对象 (仍需使用 `match_name()` 和 `match_attributes()` 确认)
+
+        :param keywords: 名称关键词
+        :param attributes: 属性键值对
+        :return: 候选聊天对象的列表 (保持原有顺序)
+        """
+
+        positions = None
+        if keywords:
+            positions = self._name_positions(keywords)
+
+        for attr, value in attributes.items():
+            if positions is not None and not positions:
+                break
+            index = self.attribute_index(attr)
+            if not index:
+                continue
+            try:
+                found = index.positions(value)
+            except TypeError:
+                # 属性值不可哈希
+                continue
+            positions = set(found) if positions is None else positions & found
+
+        if positions is None:
+            return list(self.chats)
+
+        return [self.chats[i] for i in sorted(positions)]
@@ -0,0 +1,335 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import logging
+import os
+import pickle
+import threading
+import time
+from functools import wraps
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+from wxpy.exceptions import ResponseError
+from .misc import start_new_thread
+
+logger = logging.getLogger(__name__)
+
+"""
+
+# send queue
+
+可选的发送队列，用于在发送前主动控制各类操作的频率，避免触发 Web 微信的频率限制 (错误码 1205)
+
+* 开启后，发送消息、设置备注、加好友等操作仅将请求放入队列，并立即返回 Future，不再堵塞调用者
+* 每类操作各有一个队列和后台线程，同类操作按放入顺序依次执行，因此同类操作的顺序与调用顺序一致
+* 每类操作对应一个令牌桶: 在 period 秒内最多执行 count 次，可短时突发，令牌不足时等待补充
+* 各类操作互不堵塞: 例如加好友等待令牌时，文本消息仍可照常发送
+
+
+## 自适应频率 (adaptive=True)
+
+根据实际请求的结果调整各类操作的次数 (AIMD: 加性增，乘性减)，无需像 `detect_freq_limit()` 那样主动触发限制
+
+* 操作因频率限制 (错误码 1205) 失败时: 次数减半 (至少为 1)，并清空令牌
+* 距离上次调整已超过一个周期，且操作成功时: 次数 + 1，但不超过设定的频率限制
+* 调整后的次数会保存到文件中，重启后从上次的次数开始
+
+
+"""
+
+# 操作类型
+TEXT = 'text'
+MEDIA = 'media'
+REMARK = 'remark'
+ADD_FRIEND = 'add_friend'
+
+# 表示频率限制的错误码
+FREQ_LIMIT_CODES = (1205,)
+
+# 默认的频率限制: 操作类型 -> (次数, 周期秒数)，均为经验性的保守值
+DEFAULT_LIMITS = {
+    TEXT: (20, 20),
+    MEDIA: (5, 20),
+    REMARK: (10, 60),
+    ADD_FRIEND: (2, 300),
+}
+
+
+class TokenBucket(object):
+    def __init__(self, count, period):
+        """
+        令牌桶: 在 period 秒内最多 count 次，桶满时最多可连续执行 count 次
+
+        :param count: 次数 (同时为桶的容量)
+        :param period: 周期秒数
+        """
+
+        self.count = count
+        self.period = period
+        # 自适应调整时的次数上限
+        self.max_count = count
+
+        self._tokens = float(count)
+        self._updated = time.time()
+        self._adjusted = self._updated
+        self._thread_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<{}: {}/{} secs, {:.1f} tokens>'.format(
+            self.__class__.__name__, self.count, self.period, self.tokens)
+
+    @property
+    def rate(self):
+        """
+        每秒补充的令牌数
+        """
+        return float(self.count) / self.period
+
+    @property
+    def tokens(self):
+        """
+        当前可用的令牌数
+        """
+        with self._thread_lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.count, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        尝试取出一个令牌
+
+        :return: 成功时为 0，否则为需要等待的秒数
+        """
+
+        with self._thread_lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        取出一个令牌，令牌不足时堵塞等待
+        """
+
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def decrease(self):
+        """
+        将次数减半 (至少为 1)，并清空令牌
+
+        :return: 调整后的次数
+        """
+
+        with self._thread_lock:
+            self._refill()
+            self.count = max(1, self.count // 2)
+            self._tokens = 0
+            self._adjusted = time.time()
+            return self.count
+
+    def increase(self):
+        """
+        若距离上次调整已超过一个周期，且次数小于 max_count，则将次数 + 1
+
+        :return: 若进行了调整，则为调整后的次数，否则为 None
+        """
+
+        with self._thread_lock:
+            now = time.time()
+            if self.count < self.max_count and now - self._adjusted >= self.period:
+                self._refill()
+                self.count += 1
+                self._adjusted = now
+                return self.count
+
+
+class SendQueue(object):
+    def __init__(self, limits=None, adaptive=False, path=None):
+        """
+        发送队列，可通过 :meth:`Bot.enable_send_queue` 启用 (需要 Python 3，或安装了 futures 模块的 Python 2)
+
+        :param limits:
+            各类操作的频率限制，格式为 {操作类型: (次数, 周期秒数)}，将覆盖 `DEFAULT_LIMITS` 中的对应项
+
+            操作类型可为
+
+            * 'text': 发送文本消息 (包括 `send_raw_msg()`)
+            * 'media': 发送图片、视频和文件
+            * 'remark': 设置备注名称
+            * 'add_friend': 加好友或接受好友请求
+
+        :param adaptive: 是否根据频率限制错误 (1205) 自动调整各类操作的次数 (不超过 limits 中的设定)
+        :param path: 保存自动调整后次数的文件路径，为 None 时不保存
+        """
+
+        # 确保 Future 可用
+        from concurrent.futures import Future
+        self._future_class = Future
+
+        self.limits = dict(DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+
+        self.buckets = dict((operation, TokenBucket(*limit)) for operation, limit in self.limits.items())
+
+        self.adaptive = adaptive
+        self.path = path
+
+        if self.path and os.path.isfile(self.path):
+            self.load()
+
+        self._queues = dict((operation, queue.Queue()) for operation in self.buckets)
+        self._threads = dict()
+        self._thread_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<{}: {} queued>'.format(self.__class__.__name__, self.queue_depth)
+
+    @property
+    def queue_depth(self):
+        """
+        等待执行的操作数量
+        """
+        return sum(q.qsize() for q in self._queues.values())
+
+    def in_worker(self):
+        """
+        当前是否处于发送队列的后台线程中
+        """
+        return threading.current_thread() in self._threads.values()
+
+    def submit(self, operation, func, *args, **kwargs):
+        """
+        将操作放入队列
+
+        :param operation: 操作类型
+        :param func: 需要执行的函数
+        :param args: 位置参数
+        :param kwargs: 命名参数
+        :return: 操作的 Future，可通过 `.result()` 堵塞等待结果 (例如 :class:`SentMessage`)
+        :rtype: concurrent.futures.Future
+        """
+
+        if operation not in self.buckets:
+            raise ValueError('unknown operation: {}'.format(operation))
+
+        future = self._future_class()
+        self._ensure_thread(operation)
+        self._queues[operation].put((future, func, args, kwargs))
+        return future
+
+    def join(self):
+        """
+        堵塞直到队列中的操作全部执行完成
+        """
+        for q in self._queues.values():
+            q.join()
+
+    def dump(self):
+        """
+        保存各类操作当前的次数
+        """
+        with open(self.path, 'wb') as fp:
+            pickle.dump(dict((operation, bucket.count) for operation, bucket in self.buckets.items()), fp)
+
+    def load(self):
+        """
+        载入保存的次数 (不超过当前设定的频率限制)
+        """
+        with open(self.path, 'rb') as fp:
+            counts = pickle.load(fp)
+
+        for operation, count in counts.items():
+            bucket = self.buckets.get(operation)
+            if bucket:
+                bucket.count = max(1, min(count, bucket.max_count))
+                bucket._tokens = min(bucket._tokens, bucket.count)
+
+    def _adjust(self, operation, error=None):
+        bucket = self.buckets[operation]
+
+        if isinstance(error, ResponseError) and error.err_code in FREQ_LIMIT_CODES:
+            count = bucket.decrease()
+            logger.warning('{} operations hit the freq limit, decreased to {} / {} secs'.format(
+                operation, count, bucket.period))
+        elif error is None:
+            count = bucket.increase()
+            if count is None:
+                return
+            logger.info('{} operations increased to {} / {} secs'.format(operation, count, bucket.period))
+        else:
+            return
+
+        if self.path:
+            # noinspection PyBroadException
+            try:
+                self.dump()
+            except:
+                logger.exception('failed to save the limits to {}'.format(self.path))
+
+    def _ensure_thread(self, operation):
+        if operation not in self._threads:
+            with self._thread_lock:
+                if operation not in self._threads:
+                    self._threads[operation] = start_new_thread(self._work, (operation,))
+
+    def _work(self, operation):
+        q = self._queues[operation]
+        while True:
+            future, func, args, kwargs = q.get()
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.buckets[operation].acquire()
+                # noinspection PyBroadException
+                try:
+                    ret = func(*args, **kwargs)
+                except Exception as e:
+                    logger.warning('queued {} operation failed: {}'.format(operation, e))
+                    if self.adaptive:
+                        self._adjust(operation, e)
+                    future.set_exception(e)
+                else:
+                    if self.adaptive:
+                        self._adjust(operation)
+                    future.set_result(ret)
+            finally:
+                q.task_done()
+
+
+def queued(operation):
+    """
+    装饰器: 若机器人启用了发送队列，则将方法的调用放入队列，并返回 Future，否则直接执行
+
+    :param operation: 操作类型，如 'text'
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapped(self, *args, **kwargs):
+            # self 可为聊天对象或机器人
+            bot = getattr(self, 'bot', self)
+            send_queue = getattr(bot, 'send_queue', None)
+            if send_queue is None or send_queue.in_worker():
+                return func(self, *args, **kwargs)
+            return send_queue.submit(operation, func, self, *args, **kwargs)
+
+        return wrapped
+
+    return decorator
@@ -31,10 +31,11 @@ def ensure_one(found):
 
     通常可用在查找聊天对象时，确保查找结果的唯一性，并直接获取唯一项
 
-    :param found: 列表
+    :param found: 列表 (或 :class:`wxpy.Messages`)
     :return: 唯一项
     """
-    if not isinstance(found, list):
+    from wxpy.api.messages import Messages
+    if not isinstance(found, (list, Messages)):
         raise TypeError('expected list, {} found'.format(type(found)))
     elif not found:
         raise ValueError('not found')
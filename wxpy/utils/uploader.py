@@ -0,0 +1,216 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+from .misc import check_response_body, start_new_thread
+
+logger = logging.getLogger(__name__)
+
+"""
+
+# uploader
+
+分块并行上传文件，用于替代 itchat 中逐块上传的 `upload_file()`
+
+* 请求的格式与 itchat 相同 (每块 512 KB，发送至 webwxuploadmedia)
+* 各块均通过 `bot.core.s` 的连接池发送，默认按顺序逐块上传
+* 开启 `parallel` 后，除最后一块以外，其余各块由多个线程同时上传 (尚未在 Web 微信的实际接口上充分验证，需主动开启)
+* 其余各块全部成功后，再上传最后一块，并从其响应中获取 media_id
+* 每块失败时 (网络错误或 BaseResponse 不为 0) 单独重试
+* 每块均按需读取，计算 MD5 时同样分块读取，不会将整个文件载入内存
+
+
+"""
+
+# 每块的大小 (与 Web 微信一致)
+CHUNK_SIZE = 512 * 1024
+
+
+class ChunkedUploader(object):
+    def __init__(self, bot, parallel=False, workers=4, retries=3, timeout=60):
+        """
+        分块上传文件的上传器，可设为 `bot.uploader` 来替代 itchat 的上传方式 (默认不启用)
+
+        :param bot: 所属的机器人
+        :param parallel:
+            | 是否并行上传各块 (默认关闭，按顺序逐块上传)
+            | 并行上传时各块将乱序到达服务端，目前仅在模拟的服务端上验证过，请谨慎开启
+        :param workers: 并行上传时同时上传的线程数量
+        :param retries: 每块的最大重试次数
+        :param timeout: 每块的请求超时秒数
+        """
+
+        self.bot = bot
+        self.parallel = parallel
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+
+    def __repr__(self):
+        return '<{}: {}>'.format(
+            self.__class__.__name__, '{} workers'.format(self.workers) if self.parallel else 'sequential')
+
+    def upload(self, path, kind='doc', progress=None, to_user_name='filehelper'):
+        """
+        上传文件
+
+        :param path: 文件路径
+        :param kind: 上传类型 ('pic', 'video' 或 'doc')
+        :param progress: 进度回调，每完成一块调用一次，接收参数: 已上传的字节数, 总字节数
+        :param to_user_name: 上传请求中的接收者
+        :return: 最后一块的响应数据 (其中包含 MediaId)，与 itchat 的 `upload_file()` 相同
+        :rtype: dict
+        """
+
+        if not os.path.isfile(path):
+            # 与 itchat 相同的错误
+            return {'BaseResponse': {'ErrMsg': 'No file found in specific dir', 'Ret': -1002}}
+
+        file_size = os.path.getsize(path)
+        if not file_size:
+            return {'BaseResponse': {'Ret': -1005, 'ErrMsg': 'Empty file detected'}}
+
+        chunks = (file_size - 1) // CHUNK_SIZE + 1
+        core = self.bot.core
+
+        upload_media_request = json.dumps(OrderedDict([
+            ('UploadType', 2),
+            ('BaseRequest', core.loginInfo['BaseRequest']),
+            ('ClientMediaId', int(time.time() * 1e4)),
+            ('TotalLen', file_size),
+            ('StartPos', 0),
+            ('DataLen', file_size),
+            ('MediaType', 4),
+            ('FromUserName', self.bot.self.user_name),
+            ('ToUserName', to_user_name),
+            ('FileMd5', self._md5(path))
+        ]), separators=(',', ':'))
+
+        context = dict(
+            path=path, kind=kind, file_size=file_size, chunks=chunks,
+            upload_media_request=upload_media_request,
+            file_type=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        )
+
+        logger.info('{}: uploading {} in {} chunks'.format(self.bot, path, chunks))
+
+        thread_lock = threading.Lock()
+        uploaded = [0]
+
+        def on_chunk_done(chunk):
+            with thread_lock:
+                uploaded[0] += min(CHUNK_SIZE, file_size - chunk * CHUNK_SIZE)
+                if progress:
+                    # noinspection PyBroadException
+                    try:
+                        progress(uploaded[0], file_size)
+                    except:
+                        logger.exception('an error occurred in progress callback')
+
+        # 除最后一块以外，其余各块按顺序上传，或在开启 parallel 时同时上传
+        pending = queue.Queue()
+        for chunk in range(chunks - 1):
+            pending.put(chunk)
+        errors = list()
+
+        def work():
+            while not errors:
+                try:
+                    chunk = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    self._upload_chunk(context, chunk)
+                except Exception as e:
+                    errors.append(e)
+                    return
+                on_chunk_done(chunk)
+
+        if self.parallel:
+            threads = [start_new_thread(work) for _ in range(min(self.workers, chunks - 1))]
+            for thread in threads:
+                thread.join()
+        else:
+            work()
+
+        if errors:
+            raise errors[0]
+
+        # 最后一块的响应中包含 MediaId
+        ret = self._upload_chunk(context, chunks - 1)
+        on_chunk_done(chunks - 1)
+        return ret
+
+    @staticmethod
+    def _md5(path):
+        md5 = hashlib.md5()
+        with open(path, 'rb') as fp:
+            while True:
+                data = fp.read(CHUNK_SIZE * 8)
+                if not data:
+                    break
+                md5.update(data)
+        return md5.hexdigest()
+
+    def _upload_chunk(self, context, chunk):
+        with open(context['path'], 'rb') as fp:
+            fp.seek(chunk * CHUNK_SIZE)
+            data = fp.read(CHUNK_SIZE)
+
+        for attempt in range(self.retries + 1):
+            try:
+                return self._post_chunk(context, chunk, data)
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                logger.warning('failed to upload chunk {}/{} of {}, retrying: {}'.format(
+                    chunk + 1, context['chunks'], context['path'], e))
+                time.sleep(min(2 ** attempt, 10))
+
+    def _post_chunk(self, context, chunk, data):
+        import itchat.config
+
+        core = self.bot.core
+        url = core.loginInfo.get('fileUrl', core.loginInfo['url']) + '/webwxuploadmedia?f=json'
+        file_name = os.path.basename(context['path'])
+
+        files = OrderedDict([
+            ('id', (None, 'WU_FILE_0')),
+            ('name', (None, file_name)),
+            ('type', (None, context['file_type'])),
+            ('lastModifiedDate', (None, time.strftime('%a %b %d %Y %H:%M:%S GMT+0800 (CST)'))),
+            ('size', (None, str(context['file_size']))),
+            ('chunks', (None, str(context['chunks']))),
+            ('chunk', (None, str(chunk))),
+            ('mediatype', (None, context['kind'])),
+            ('uploadmediarequest', (None, context['upload_media_request'])),
+            ('webwx_data_ticket', (None, core.s.cookies.get('webwx_data_ticket'))),
+            ('pass_ticket', (None, core.loginInfo['pass_ticket'])),
+            ('filename', (file_name, data, 'application/octet-stream')),
+        ])
+
+        if context['chunks'] == 1:
+            del files['chunks']
+            del files['chunk']
+
+        resp = core.s.post(
+            url, files=files, headers={'User-Agent': itchat.config.USER_AGENT}, timeout=self.timeout)
+        resp.raise_for_status()
+
+        ret = resp.json()
+        check_response_body(ret)
+        return ret
@@ -0,0 +1,224 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+from .misc import start_new_thread
+
+logger = logging.getLogger(__name__)
+
+# 队列已满时的处理策略
+
+# 堵塞，直到队列中有空位
+BLOCK = 'block'
+# 丢弃新的任务
+DISCARD = 'discard'
+# 丢弃队列中最旧的任务，再加入新的任务
+DISCARD_OLDEST = 'discard_oldest'
+# 在提交任务的线程中直接执行
+CALLER_RUNS = 'caller_runs'
+
+FULL_POLICIES = BLOCK, DISCARD, DISCARD_OLDEST, CALLER_RUNS
+
+
+class WorkerPool(object):
+    def __init__(self, size=10, queue_size=1000, full_policy=BLOCK):
+        """
+        固定线程数量的任务执行池，用于执行 `run_async=True` 的消息处理函数
+
+        工作线程将在首次提交任务时启动
+
+        :param size: 最大的工作线程数量
+        :param queue_size: 等待执行的任务队列长度，为 0 或 None 时不限制
+        :param full_policy:
+            队列已满时的处理策略，可为
+
+            * 'block': 堵塞，直到队列中有空位 (会暂停消息的接收)
+            * 'discard': 丢弃新的任务
+            * 'discard_oldest': 丢弃队列中最旧的任务
+            * 'caller_runs': 在提交任务的线程中直接执行
+        """
+
+        if full_policy not in FULL_POLICIES:
+            raise ValueError('full_policy should be one of {}'.format(FULL_POLICIES))
+
+        self.size = size
+        self.queue_size = queue_size
+        self.full_policy = full_policy
+
+        self._queue = queue.Queue(queue_size or 0)
+        self._workers = list()
+        self._active = 0
+        self._thread_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<{}: {}/{} active, {} queued>'.format(
+            self.__class__.__name__, self.active_workers, self.size, self.queue_depth)
+
+    @property
+    def queue_depth(self):
+        """
+        等待执行的任务数量
+        """
+        return self._queue.qsize()
+
+    @property
+    def active_workers(self):
+        """
+        正在执行任务的工作线程数量
+        """
+        return self._active
+
+    @property
+    def workers(self):
+        """
+        已启动的工作线程数量
+        """
+        return len(self._workers)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        提交一个任务
+
+        :param func: 需要执行的函数
+        :param args: 位置参数
+        :param kwargs: 命名参数
+        :return: 若任务被执行或加入队列，则为 True，若被丢弃，则为 False
+        """
+
+        task = func, args, kwargs
+        self._ensure_workers()
+
+        if self.full_policy == BLOCK:
+            self._queue.put(task)
+            return True
+
+        while True:
+            try:
+                self._queue.put_nowait(task)
+                return True
+            except queue.Full:
+                pass
+
+            if self.full_policy == DISCARD:
+                logger.warning('{}: queue is full, discarding task: {}'.format(self, func))
+                return False
+            elif self.full_policy == CALLER_RUNS:
+                self._run(task)
+                return True
+            else:
+                try:
+                    dropped = self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self._queue.task_done()
+                logger.warning('{}: queue is full, discarding the oldest task: {}'.format(self, dropped[0]))
+
+    def join(self):
+        """
+        堵塞直到所有已提交的任务执行完成
+        """
+        self._queue.join()
+
+    def _ensure_workers(self):
+        if len(self._workers) < self.size:
+            with self._thread_lock:
+                while len(self._workers) < self.size:
+                    self._workers.append(start_new_thread(self._work))
+
+    def _run(self, task):
+        func, args, kwargs = task
+        with self._thread_lock:
+            self._active += 1
+        # noinspection PyBroadException
+        try:
+            func(*args, **kwargs)
+        except:
+            logger.exception('an error occurred in {}'.format(func))
+        finally:
+            with self._thread_lock:
+                self._active -= 1
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                self._run(task)
+            finally:
+                self._queue.task_done()
+
+
+class ShardedWorkerPool(object):
+    def __init__(self, shards=10, queue_size=1000, full_policy=BLOCK):
+        """
+        按键分片的任务执行池，用于执行 `run_async=True, in_order=True` 的消息处理函数
+
+        | 每个分片为单个工作线程的 :class:`WorkerPool`，相同键的任务总是进入同一分片，因此按提交顺序依次执行
+        | 不同键的任务分布在多个分片中，可并行执行
+
+        :param shards: 分片 (即工作线程) 的数量
+        :param queue_size: 每个分片的任务队列长度，为 0 或 None 时不限制
+        :param full_policy: 分片的队列已满时的处理策略，与 :class:`WorkerPool` 相同 (使用 'caller_runs' 时将无法保证顺序)
+        """
+
+        self._shards = [WorkerPool(1, queue_size, full_policy) for _ in range(shards)]
+
+    def __repr__(self):
+        return '<{}: {}/{} active, {} queued>'.format(
+            self.__class__.__name__, self.active_workers, len(self._shards), self.queue_depth)
+
+    @property
+    def queue_depth(self):
+        """
+        所有分片中等待执行的任务数量
+        """
+        return sum(shard.queue_depth for shard in self._shards)
+
+    @property
+    def active_workers(self):
+        """
+        正在执行任务的工作线程数量
+        """
+        return sum(shard.active_workers for shard in self._shards)
+
+    @property
+    def workers(self):
+        """
+        已启动的工作线程数量
+        """
+        return sum(shard.workers for shard in self._shards)
+
+    def shard(self, key):
+        """
+        获取键所对应的分片
+
+        :param key: 分片的键 (例如聊天对象的 user_name)
+        :rtype: :class:`WorkerPool`
+        """
+        return self._shards[hash(key) % len(self._shards)]
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        提交一个任务，相同键的任务将按提交顺序依次执行
+
+        :param key: 分片的键 (例如聊天对象的 user_name)
+        :param func: 需要执行的函数
+        :param args: 位置参数
+        :param kwargs: 命名参数
+        :return: 若任务被执行或加入队列，则为 True，若被丢弃，则为 False
+        """
+        return self.shard(key).submit(func, *args, **kwargs)
+
+    def join(self):
+        """
+        堵塞直到所有已提交的任务执行完成
+        """
+        for shard in self._shards:
+            shard.join()